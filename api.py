@@ -0,0 +1,483 @@
+# HTTP API entrypoint (headless counterpart of app.py: upload, ingest status, ask, streaming ask)
+#
+#   python api.py                      # uvicorn with API_WORKERS processes
+#   uvicorn api:app --port 8000        # or any ASGI server
+import asyncio
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from src.vector_store import update_session_vectorstore
+from src.qa_chain import get_cached_qa_chain
+from src.guardrail import validate_safety, validate_output_quality, StreamingOutputGuard
+from src.memory_store import create_session_memory
+from src.warmup import start_warm_up, get_warm_up
+from src.index_cache import compute_content_hash, make_index_cache_key, combine_cache_keys
+from src.ingest_jobs import get_ingestion_manager, ingest_pdf, DONE
+from src.metrics import render_prometheus, increment
+from src.config import settings
+
+INVALID_ANSWER = "I can only answer questions based on the content of the uploaded document. Please ask something related to the uploaded file."
+
+class ApiSession:
+    """Per-session state: documents, the store the session searches, conversation memory"""
+    def __init__(self, session_id=None):
+        self.id = session_id or uuid.uuid4().hex
+        self.documents = {}  # source_id -> {"name", "status", "job_id", "error"}
+        self.doc_stores = {}  # source_id -> shared, read-only per-document store
+        self.vectorstore = None
+        self.store_version = 0
+        # Kept in MEMORY_BACKEND when configured, so the conversation outlives this worker
+        self.memory = create_session_memory(session_id=self.id)
+        self.chain_cache = {}  # get_cached_qa_chain's cache
+        self.lock = asyncio.Lock()  # one question / document change at a time per session
+        self.last_used = time.monotonic()
+
+    def sync_documents(self, ingestion):
+        """Move finished ingestion jobs into the session index (no re-embedding)"""
+        for source_id, document in self.documents.items():
+            if document["status"] != "processing":
+                continue
+            job = ingestion.get(document["job_id"])
+            if job is None or not job.finished:
+                continue
+            if job.status == DONE and job.result and job.result["vectorstore"] is not None:
+                document["status"] = "ready"
+                self.doc_stores[source_id] = job.result["vectorstore"]
+                self._update_index(added=source_id)
+            else:
+                document["status"] = "failed"
+                document["error"] = job.error or "Could not extract any text from the document"
+
+    def remove_document(self, ingestion, source_id):
+        document = self.documents.pop(source_id)
+        if document["status"] == "processing":
+            ingestion.cancel(document["job_id"])
+        elif document["status"] == "ready":
+            self._update_index(removed=source_id)
+
+    def _update_index(self, added=None, removed=None):
+        names = {source_id: document["name"] for source_id, document in self.documents.items()}
+        self.vectorstore = update_session_vectorstore(
+            self.vectorstore, self.doc_stores, names, added=added, removed=removed
+        )
+        if removed:
+            self.doc_stores.pop(removed, None)
+        self.store_version += 1
+
+    def ready_sources(self):
+        return [source_id for source_id, document in self.documents.items() if document["status"] == "ready"]
+
+    def describe(self):
+        return {
+            "session_id": self.id,
+            "documents": [
+                {"source_id": source_id, **{key: value for key, value in document.items() if value is not None}}
+                for source_id, document in self.documents.items()
+            ],
+        }
+
+class SessionRegistry:
+    """In-process sessions with idle expiry and a size cap (least recently used go first)"""
+    def __init__(self, ttl_seconds, max_sessions):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id=None):
+        with self._lock:
+            if session_id in self._sessions:
+                return self._sessions[session_id]
+        session = ApiSession(session_id)
+        with self._lock:
+            self._expire()
+            while len(self._sessions) >= self.max_sessions:
+                oldest = min(self._sessions.values(), key=lambda s: s.last_used)
+                self._drop(oldest)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired session")
+        session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                self._drop(session)
+        if session:
+            # Expired or evicted sessions keep their stored memory (until MEMORY_TTL_SECONDS); deleted ones do not
+            session.memory.clear()
+
+    def _expire(self):
+        now = time.monotonic()
+        for session in [s for s in self._sessions.values() if now - s.last_used > self.ttl_seconds]:
+            self._drop(session)
+
+    def _drop(self, session):
+        self._sessions.pop(session.id, None)
+        ingestion = get_ingestion_manager()
+        for document in session.documents.values():
+            if document["status"] == "processing":
+                ingestion.cancel(document["job_id"])
+
+class CreateSessionRequest(BaseModel):
+    # Resume the conversation memory stored under this id (with a shared MEMORY_BACKEND)
+    session_id: Optional[str] = Field(None, pattern=r"^[0-9a-f]{32}$")
+
+class AskRequest(BaseModel):
+    question: str
+    sources: Optional[List[str]] = None  # restrict retrieval to these source_ids
+
+class BatchAskRequest(BaseModel):
+    questions: List[str]
+    sources: Optional[List[str]] = None
+
+sessions = SessionRegistry(settings.API_SESSION_TTL_SECONDS, settings.API_MAX_SESSIONS)
+
+# Blocking work (retrieval, Groq calls, index updates) runs here so the event loop stays free;
+# the semaphore bounds questions in flight and turns overload into fast 503s
+_executor = ThreadPoolExecutor(max_workers=settings.API_MAX_CONCURRENT_QUESTIONS, thread_name_prefix="api")
+_question_slots = asyncio.Semaphore(settings.API_MAX_CONCURRENT_QUESTIONS)
+
+def _busy(detail):
+    increment("api_rejected_requests")
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": "2"})
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+async def _acquire_question_slot():
+    try:
+        await asyncio.wait_for(_question_slots.acquire(), timeout=settings.API_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise _busy("Too many questions in flight. Please retry shortly.")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load models once per worker process in the background; /readyz reports when done
+    start_warm_up()
+    yield
+
+app = FastAPI(title="File Q&A Bot API", lifespan=lifespan)
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """503 until the warm-up (embedding model etc.) has finished, so a balancer can hold traffic"""
+    warm_up = get_warm_up()
+    if warm_up is None or not warm_up.ready:
+        raise HTTPException(503, "Warming up", headers={"Retry-After": "5"})
+    return warm_up.describe()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_prometheus()
+
+@app.post("/sessions")
+async def create_session(request: Optional[CreateSessionRequest] = None):
+    # Off the event loop: with a memory backend this reads the stored conversation
+    session = await _run(sessions.create, request.session_id if request else None)
+    return session.describe()
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = sessions.get(session_id)
+    async with session.lock:
+        await _run(session.sync_documents, get_ingestion_manager())
+    return session.describe()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    sessions.delete(session_id)
+    return {"deleted": session_id}
+
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def _read_upload(file, limit):
+    """The upload's bytes, read in chunks so an oversized file is refused (413) before it is all in memory"""
+    too_large = HTTPException(status_code=413, detail=f"PDFs are limited to {settings.API_MAX_UPLOAD_MB} MB")
+    if file.size is not None and file.size > limit:
+        raise too_large
+    data = bytearray()
+    while True:
+        chunk = await file.read(_UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return bytes(data)
+        data += chunk
+        if len(data) > limit:
+            raise too_large
+
+@app.post("/sessions/{session_id}/documents", status_code=202)
+async def upload_document(session_id: str, file: UploadFile = File(...)):
+    session = sessions.get(session_id)
+    data = await _read_upload(file, settings.API_MAX_UPLOAD_MB * 1024 * 1024)
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+    # Same bytes + same index settings => same id, so the shared index cache applies
+    source_id = make_index_cache_key(await _run(compute_content_hash, data))
+    async with session.lock:
+        if source_id in session.documents:
+            return {"source_id": source_id, **session.documents[source_id]}
+
+        try:
+            # Parsed from memory (no upload file); smaller files first so quick uploads
+            # are not stuck behind long OCR jobs
+            job = get_ingestion_manager().submit(
+                ingest_pdf, data,
+                metadata={"source": file.filename},
+                cache_key=source_id,
+                priority=len(data)
+            )
+        except queue.Full:
+            raise _busy("The server is busy processing other documents. Please retry shortly.")
+        session.documents[source_id] = {"name": file.filename, "status": "processing", "job_id": job.id, "error": None}
+    return {"source_id": source_id, **session.documents[source_id]}
+
+@app.delete("/sessions/{session_id}/documents/{source_id}")
+async def delete_document(session_id: str, source_id: str):
+    session = sessions.get(session_id)
+    async with session.lock:
+        if source_id not in session.documents:
+            raise HTTPException(status_code=404, detail="Unknown document")
+        await _run(session.remove_document, get_ingestion_manager(), source_id)
+    return session.describe()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = get_ingestion_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "message": job.last_message,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+def _prepare_chain(session, request):
+    """Sync finished documents and return the session's QA chain (called under session.lock)"""
+    session.sync_documents(get_ingestion_manager())
+    if session.vectorstore is None:
+        processing = any(document["status"] == "processing" for document in session.documents.values())
+        raise HTTPException(
+            status_code=409,
+            detail="Documents are still being processed" if processing else "Upload a PDF before asking questions"
+        )
+
+    ready_sources = session.ready_sources()
+    selected = [source_id for source_id in (request.sources or ready_sources) if source_id in ready_sources] or ready_sources
+    return get_cached_qa_chain(
+        session.chain_cache, session.vectorstore, session.memory,
+        doc_key=combine_cache_keys(selected),
+        sources=selected if len(selected) < len(ready_sources) else None,
+        version=session.store_version
+    )
+
+def _document_name(session, doc):
+    # Cached per-document stores are shared by everyone who uploaded the same bytes, so their
+    # "source" metadata is the first uploader's filename; cite this session's own name instead
+    source_id = doc.metadata.get("source_id")
+    if source_id is None:
+        # Only a single-document session searches a shared store directly
+        ready = session.ready_sources()
+        source_id = ready[0] if len(ready) == 1 else None
+    document = session.documents.get(source_id)
+    return document["name"] if document else None
+
+def _citations(session, source_docs):
+    seen = []
+    for doc in source_docs:
+        citation = {"source": _document_name(session, doc), "page": doc.metadata.get("page")}
+        if citation not in seen:
+            seen.append(citation)
+    return seen
+
+def _format_result(session, question, result):
+    source_docs = result.get("source_documents", [])
+    is_valid, response = validate_output_quality(
+        result["answer"], source_docs, question, result.get("question_type", "document")
+    )
+    return {
+        "answer": response if is_valid else INVALID_ANSWER,
+        "valid": is_valid,
+        "question_type": result.get("question_type", "document"),
+        "cached": result.get("cached", False),
+        "citations": _citations(session, source_docs) if is_valid else [],
+    }
+
+def _answer(session, request):
+    chain = _prepare_chain(session, request)
+    return _format_result(session, request.question, chain({"question": request.question}))
+
+def _answer_batch(session, request, questions):
+    chain = _prepare_chain(session, request)
+    return [_format_result(session, question, result) for question, result in zip(questions, chain.batch(questions))]
+
+def _check_question(request):
+    ok, reason = validate_safety(request.question)
+    if not ok:
+        raise HTTPException(status_code=400, detail=reason)
+
+@app.post("/sessions/{session_id}/ask")
+async def ask(session_id: str, request: AskRequest):
+    session = sessions.get(session_id)
+    _check_question(request)
+    await _acquire_question_slot()
+    try:
+        async with session.lock:
+            return await _run(_answer, session, request)
+    finally:
+        _question_slots.release()
+
+@app.post("/sessions/{session_id}/ask/batch")
+async def ask_batch(session_id: str, request: BatchAskRequest):
+    """
+    Answer several questions with shared retrieval and concurrent LLM calls
+    Results come back in question order; a question failing the safety check gets
+    valid=false with the reason instead of failing the whole batch
+    """
+    session = sessions.get(session_id)
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(request.questions) > settings.API_MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.API_MAX_BATCH_QUESTIONS} questions per batch")
+
+    results = [None] * len(request.questions)
+    accepted = []
+    for i, question in enumerate(request.questions):
+        ok, reason = validate_safety(question)
+        if ok:
+            accepted.append(i)
+        else:
+            results[i] = {"answer": reason, "valid": False, "question_type": None, "cached": False, "citations": []}
+
+    if accepted:
+        # One slot for the whole batch; the chain bounds its own LLM concurrency
+        await _acquire_question_slot()
+        try:
+            async with session.lock:
+                answers = await _run(_answer_batch, session, request, [request.questions[i] for i in accepted])
+        finally:
+            _question_slots.release()
+        for i, answer in zip(accepted, answers):
+            results[i] = answer
+    return {"results": [dict(result, question=question) for question, result in zip(request.questions, results)]}
+
+class _CleanupStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls on_done when the response ends, even if the body was never iterated"""
+    def __init__(self, content, on_done, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_done = on_done
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_done()
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/sessions/{session_id}/ask/stream")
+async def ask_stream(session_id: str, request: AskRequest):
+    """
+    Server-sent events: "token" events as the answer is generated, then one "done"
+    event with the validated answer (which replaces the streamed text) and citations
+    """
+    session = sessions.get(session_id)
+    _check_question(request)
+    await _acquire_question_slot()
+    locked = False
+    try:
+        # Cancelled while waiting for a busy session: only the slot is held
+        await session.lock.acquire()
+        locked = True
+        chain = await _run(_prepare_chain, session, request)
+        streaming = await _run(chain.stream, {"question": request.question})
+    except BaseException:
+        if locked:
+            session.lock.release()
+        _question_slots.release()
+        raise
+
+    guard = StreamingOutputGuard(streaming.source_documents, request.question, streaming.question_type)
+    chunks = guard.stream(streaming)
+    finished = object()
+    # next() and close() must not overlap: close() on a generator still inside next() raises
+    pull_lock = threading.Lock()
+    loop = asyncio.get_running_loop()
+    cleaned_up = False
+
+    def pull():
+        with pull_lock:
+            return next(chunks, finished)
+
+    def close():
+        with pull_lock:
+            chunks.close()
+
+    def release(_future=None):
+        session.lock.release()
+        _question_slots.release()
+
+    def cleanup():
+        # Never awaited, so a cancelled (disconnected) response cannot skip it: generation
+        # stops and memory is saved on the executor, then the lock and slot are released
+        nonlocal cleaned_up
+        if cleaned_up:
+            return
+        cleaned_up = True
+        try:
+            future = _executor.submit(close)
+        except RuntimeError:
+            release()  # executor shut down
+            return
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+
+    async def events():
+        try:
+            while True:
+                # Pull chunks on the executor: the Groq stream is blocking I/O
+                chunk = await _run(pull)
+                if chunk is finished:
+                    break
+                yield _sse("token", {"text": chunk})
+            is_valid, response = await _run(guard.finalize)
+            yield _sse("done", {
+                "answer": response if is_valid else INVALID_ANSWER,
+                "valid": is_valid,
+                "question_type": streaming.question_type,
+                "cached": streaming.cached,
+                "citations": _citations(session, streaming.source_documents) if is_valid else [],
+            })
+        finally:
+            cleanup()
+
+    return _CleanupStreamingResponse(events(), cleanup, media_type="text/event-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("api:app", host=settings.API_HOST, port=settings.API_PORT, workers=settings.API_WORKERS)
@@ -1,74 +1,149 @@
 # Streamlit entrypoint (UI: upload, chat, greeting)
 import streamlit as st
-from src.pdf_parser import extract_text_from_pdf
-from src.vector_store import create_fresh_vectorstore, cleanup_session_data
-from src.qa_chain import build_qa_chain
-from src.guardrail import validate_safety, validate_output_quality
+from src.vector_store import update_session_vectorstore, cleanup_session_data
+from src.qa_chain import get_cached_qa_chain
+from src.guardrail import validate_safety, validate_output_quality, StreamingOutputGuard
 from src.memory_store import create_session_memory
+from src.warmup import start_warm_up
+from src.index_cache import compute_content_hash, make_index_cache_key, combine_cache_keys
+from src.ingest_jobs import get_ingestion_manager, ingest_pdf, DONE, QUEUED
 from src.config import settings
-import os
+import queue
 import uuid
 
 st.set_page_config(page_title="File Q&A Bot", layout="wide")
 st.title("📄 Q&A Bot — Upload a PDF & Ask")
 
+@st.cache_resource(show_spinner=False)
+def warm_up_models():
+    """Load shared models once per server process, in the background so the page renders at once"""
+    return start_warm_up()
+
+warm_up = warm_up_models()
+
 # Initialize session state
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
     st.session_state.conversation_memory = create_session_memory()
-    st.session_state.current_file = None
-    st.session_state.vectorstore = None
+    st.session_state.documents = {}  # source_id -> {"name", "status", "job_id"}
+    st.session_state.file_sources = {}  # uploader file_id -> source_id
+    st.session_state.doc_stores = {}  # source_id -> shared, read-only per-document store
+    st.session_state.vectorstore = None  # what the chat searches (see update_session_index)
+    st.session_state.store_version = 0
     st.session_state.messages = []
 
 # Greeting
 if not st.session_state.messages:
-    greeting = "Hi, welcome to the Q&A bot! Please upload a file and I'll help answer your questions about it."
+    greeting = "Hi, welcome to the Q&A bot! Please upload one or more files and I'll help answer your questions about them."
     st.session_state.messages.append({"role": "assistant", "content": greeting})
 
 # File upload section
 st.sidebar.header("📁 File Upload")
-uploaded_file = st.sidebar.file_uploader("Upload a PDF", type=["pdf"])
-
-if uploaded_file:
-    # Check if this is a new file
-    if st.session_state.current_file != uploaded_file.name:
-        # Clear previous conversation and data for new file
-        st.session_state.messages = []
-        st.session_state.conversation_memory = create_session_memory()
-        st.session_state.current_file = uploaded_file.name
-        
-        # Process new file
-        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-        file_path = os.path.join(settings.UPLOAD_DIR, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        with st.spinner("Processing document..."):
-            # Clean up previous session data if exists
-            if hasattr(st.session_state, 'previous_session_id'):
-                cleanup_session_data(st.session_state.previous_session_id)
-            
-            # Extract text and create fresh vector store
-            text = extract_text_from_pdf(file_path)
-            vectorstore = create_fresh_vectorstore(
-                text, 
-                metadata={
-                    "source": uploaded_file.name,
-                    "session_id": st.session_state.session_id
-                }
-            )
-            st.session_state.vectorstore = vectorstore
-            st.session_state.previous_session_id = st.session_state.session_id
-        
-        st.sidebar.success(f" {uploaded_file.name} processed successfully!")
+uploaded_files = st.sidebar.file_uploader("Upload PDFs", type=["pdf"], accept_multiple_files=True)
+if not warm_up.ready:
+    st.sidebar.caption("⏳ Loading models in the background - the first upload may wait for them.")
+
+ingestion = get_ingestion_manager()
+documents = st.session_state.documents
+doc_stores = st.session_state.doc_stores
+
+def update_session_index(added=None, removed=None):
+    """Keep st.session_state.vectorstore in step with the ready documents"""
+    names = {source_id: document["name"] for source_id, document in documents.items()}
+    st.session_state.vectorstore = update_session_vectorstore(
+        st.session_state.vectorstore, doc_stores, names, added=added, removed=removed
+    )
+    if removed:
+        doc_stores.pop(removed, None)
+    st.session_state.store_version += 1
+
+# Map uploads to content-addressed source ids (hashed once per uploaded file)
+uploaded_sources = {}
+for uploaded_file in uploaded_files or []:
+    source_id = st.session_state.file_sources.get(uploaded_file.file_id)
+    if source_id is None:
+        # Same bytes + same index settings => same id, so the index cache applies
+        source_id = make_index_cache_key(compute_content_hash(uploaded_file.getbuffer()))
+        st.session_state.file_sources[uploaded_file.file_id] = source_id
+    uploaded_sources[source_id] = uploaded_file
+
+# Newly uploaded documents: index each one on its own in the background
+for source_id, uploaded_file in uploaded_sources.items():
+    if source_id in documents:
+        continue
+    
+    try:
+        # Parsed from memory (no upload file); smaller files first so quick uploads
+        # are not stuck behind long OCR jobs
+        job = ingestion.submit(
+            ingest_pdf, uploaded_file.getvalue(),
+            metadata={"source": uploaded_file.name},
+            cache_key=source_id,
+            priority=uploaded_file.size
+        )
+        documents[source_id] = {"name": uploaded_file.name, "status": "processing", "job_id": job.id}
+    except queue.Full:
+        st.sidebar.error(f"The server is busy processing other documents. Please re-upload {uploaded_file.name} shortly.")
+
+# Removed documents: stop their jobs and delete their vectors
+for source_id in [source_id for source_id in documents if source_id not in uploaded_sources]:
+    removed = documents.pop(source_id)
+    if removed["status"] == "processing":
+        ingestion.cancel(removed["job_id"])
+    elif removed["status"] == "ready":
+        update_session_index(removed=source_id)
+
+# Finished jobs: add the document to the session index (no re-embedding)
+for source_id, document in documents.items():
+    if document["status"] != "processing":
+        continue
+    job = ingestion.get(document["job_id"])
+    if job is None or not job.finished:
+        continue
+    
+    if job.status == DONE and job.result and job.result["vectorstore"] is not None:
+        document["status"] = "ready"
+        doc_stores[source_id] = job.result["vectorstore"]
+        update_session_index(added=source_id)
+        st.sidebar.success(f" {document['name']} processed successfully!")
         
         # Add welcome message for new file
-        welcome_msg = f"Great! I've processed '{uploaded_file.name}'. You can now ask me questions about this document."
+        welcome_msg = f"Great! I've processed '{document['name']}'. You can now ask me questions about it."
         st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
+    else:
+        document["status"] = "failed"
+        st.sidebar.error(f" Could not extract any text from {document['name']}. {job.error or ''}")
+
+if any(document["status"] == "processing" for document in documents.values()):
+    # Poll progress without rerunning the whole script (chat stays responsive)
+    @st.fragment(run_every=1.0)
+    def show_ingestion_progress():
+        for document in st.session_state.documents.values():
+            if document["status"] != "processing":
+                continue
+            current = ingestion.get(document["job_id"])
+            if current is None or current.finished:
+                st.rerun()
+            label = "waiting for a free worker..." if current.status == QUEUED else "processing..."
+            st.info(f"⏳ {document['name']}: {label}")
+            st.caption(current.last_message)
+    
+    with st.sidebar:
+        show_ingestion_progress()
 
-# Display current file info
-if st.session_state.current_file:
-    st.sidebar.info(f"📄 Current file: {st.session_state.current_file}")
+# Display document info and retrieval filter
+ready_sources = {source_id: document["name"] for source_id, document in documents.items() if document["status"] == "ready"}
+if ready_sources:
+    st.sidebar.info("📄 Documents: " + ", ".join(ready_sources.values()))
+if len(ready_sources) > 1:
+    selected_sources = st.sidebar.multiselect(
+        "Search in",
+        options=list(ready_sources),
+        default=list(ready_sources),
+        format_func=ready_sources.get
+    ) or list(ready_sources)
+else:
+    selected_sources = list(ready_sources)
 
 # Chat interface
 st.header("💬 Chat")
@@ -79,10 +154,13 @@ for message in st.session_state.messages:
         st.markdown(message["content"])
 
 # Chat input
-if prompt := st.chat_input("Ask a question about the uploaded file..."):
+if prompt := st.chat_input("Ask a question about the uploaded files..."):
     # Check if file is uploaded
     if not st.session_state.vectorstore:
-        st.error("⚠️ Please upload a PDF file first before asking questions.")
+        if documents:
+            st.warning("⏳ Your document is still being processed. Please ask again in a moment.")
+        else:
+            st.error("⚠️ Please upload a PDF file first before asking questions.")
         st.stop()
     
     # Add user message to chat
@@ -101,12 +179,30 @@ if prompt := st.chat_input("Ask a question about the uploaded file..."):
     
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # Build QA chain with memory and get response
-                chain = build_qa_chain(st.session_state.vectorstore, st.session_state.conversation_memory)
+        try:
+            # Reuse this session's QA chain; rebuilt only when the document or memory changes
+            chain = get_cached_qa_chain(
+                st.session_state, st.session_state.vectorstore, st.session_state.conversation_memory,
+                doc_key=combine_cache_keys(selected_sources),
+                sources=selected_sources if len(selected_sources) < len(ready_sources) else None,
+                version=st.session_state.store_version
+            )
+            answer_box = st.empty()
+            
+            if settings.STREAM_ANSWERS:
+                # Spinner covers retrieval only; tokens render as soon as they arrive
+                with st.spinner("Searching the document..."):
+                    streaming = chain.stream({"question": prompt})
+                source_docs = streaming.source_documents
+                question_type = streaming.question_type
                 
-                res = chain({"question": prompt})
+                guard = StreamingOutputGuard(source_docs, prompt, question_type)
+                with answer_box.container():
+                    st.write_stream(guard.stream(streaming))
+                is_valid, response = guard.finalize()
+            else:
+                with st.spinner("Thinking..."):
+                    res = chain({"question": prompt})
                 
                 answer = res["answer"]
                 source_docs = res.get("source_documents", [])
@@ -116,22 +212,23 @@ if prompt := st.chat_input("Ask a question about the uploaded file..."):
                 is_valid, response = validate_output_quality(
                     answer, source_docs, prompt, question_type
                 )
-                
-                if not is_valid:
-                    response = "I can only answer questions based on the content of the uploaded document. Please ask something related to the uploaded file."
-                
-                # Display response
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-                
-                            
-            except Exception as e:
-                error_response = f"I encountered an error while processing your question: {str(e)}. Please try rephrasing your question or upload a new document."
-                st.error(error_response)
-                st.session_state.messages.append({"role": "assistant", "content": error_response})
-                # For debugging - you can remove this in production
-                st.write("Debug info:", str(e))
+            
+            if not is_valid:
+                response = "I can only answer questions based on the content of the uploaded document. Please ask something related to the uploaded file."
+            
+            # Display response (replaces the raw stream with the validated, formatted answer)
+            answer_box.markdown(response)
+            pages = sorted({doc.metadata.get("page") for doc in source_docs if doc.metadata.get("page")})
+            if is_valid and question_type == "document" and pages:
+                st.caption("Sources: " + ", ".join(f"page {page}" for page in pages))
+            st.session_state.messages.append({"role": "assistant", "content": response})
+                        
+        except Exception as e:
+            error_response = f"I encountered an error while processing your question: {str(e)}. Please try rephrasing your question or upload a new document."
+            st.error(error_response)
+            st.session_state.messages.append({"role": "assistant", "content": error_response})
+            # For debugging - you can remove this in production
+            st.write("Debug info:", str(e))
 
 # Sidebar controls
 st.sidebar.header("🔧 Controls")
@@ -145,6 +242,10 @@ if st.sidebar.button("🔄 Reset Session"):
     if hasattr(st.session_state, 'session_id'):
         cleanup_session_data(st.session_state.session_id)
     
+    for document in st.session_state.get("documents", {}).values():
+        if document["status"] == "processing":
+            ingestion.cancel(document["job_id"])
+    
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     st.rerun()
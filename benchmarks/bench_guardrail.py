@@ -0,0 +1,176 @@
+# benchmarks/bench_guardrail.py
+# Cost of the compiled guardrail engine vs. per-rule loops as rule lists grow
+#
+#   python benchmarks/bench_guardrail.py --rules 10,100,500
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MAX_CHUNK_SIZE", "1000")
+os.environ.setdefault("CHUNK_OVERLAP", "200")
+
+from src.guardrail import RULE_SETS, GuardrailEngine, _has_overlap
+
+_WORDS = (
+    "pump valve pressure sensor module controller firmware revision clause warranty supplier "
+    "invoice delivery schedule maintenance inspection report torque voltage battery housing"
+).split()
+
+OVERLAPPING_RULES = {
+    "harmful_patterns": [r"(?:ways|methods) to (?:hack|steal)", r"(\w+) \1 \1"],
+    "conversation_patterns": [r"(?:you|we) said .*", r"(?P<w>\w+) or (?P=w) earlier"],
+}
+# Fragments that match the rules above, sometimes inside each other's matches
+OVERLAPPING_FRAGMENTS = [
+    "you said ways to steal", "we said methods to hack", "pump pump pump", "valve or valve earlier",
+]
+
+def make_rules(n_rules, seed=0):
+    """Built-in rules padded with n_rules synthetic entries per rule set"""
+    rng = random.Random(seed)
+    def phrase(words):
+        return " ".join(rng.choice(_WORDS) + str(rng.randint(0, 999)) for _ in range(words))
+    rules = {name: list(values) for name, values in RULE_SETS.items()}
+    rules["harmful_terms"] += [phrase(1) for _ in range(n_rules)]
+    rules["harmful_patterns"] += [rf"{phrase(1)} (a|the) {phrase(1)}" for _ in range(n_rules)]
+    rules["conversation_patterns"] += [rf"{phrase(2)} (before|earlier)" for _ in range(n_rules)]
+    rules["general_knowledge_indicators"] += [phrase(3) for _ in range(n_rules)]
+    # Rules without a literal prefix (the engine's fallback path), overlapping across labels
+    rules["harmful_patterns"] += OVERLAPPING_RULES["harmful_patterns"]
+    rules["conversation_patterns"] += OVERLAPPING_RULES["conversation_patterns"]
+    rules["hedging_phrases"] += [phrase(2).capitalize() + ", " for _ in range(n_rules)]
+    return rules
+
+class LoopGuardrails:
+    """Reference: one scan per rule, as guardrail.py worked before the engine"""
+    def __init__(self, rules):
+        self.rules = rules
+
+    def safety(self, question):
+        question_lower = question.lower().strip()
+        if any(term in question_lower for term in self.rules["harmful_terms"]):
+            return "term"
+        for pattern in self.rules["harmful_patterns"]:
+            if re.search(pattern, question_lower):
+                return "pattern"
+        return None
+
+    def classify(self, question):
+        question_lower = question.lower().strip()
+        if question_lower in self.rules["greetings"]:
+            return "greeting"
+        if any(re.search(pattern, question_lower) for pattern in self.rules["conversation_patterns"]):
+            return "conversation"
+        return "document"
+
+    def output(self, answer, docs):
+        answer_lower = answer.lower().strip()
+        if any(indicator in answer_lower for indicator in self.rules["general_knowledge_indicators"]):
+            return False
+        source_words = set(" ".join(doc.page_content.lower() for doc in docs[:2]).split())
+        answer_words = set(answer_lower.split())
+        return not (len(answer_words) > 10 and len(answer_words & source_words) < 2)
+
+    def strip_hedging(self, answer):
+        for phrase in self.rules["hedging_phrases"]:
+            answer = answer.replace(phrase, "")
+        return answer
+
+class EngineGuardrails:
+    def __init__(self, rules):
+        self.engine = GuardrailEngine(rules)
+
+    def safety(self, question):
+        # Uncached scan, so repeated questions do not flatter the engine
+        return self.engine._scan_question(question.lower().strip())["harmful"]
+
+    def classify(self, question):
+        question_lower = question.lower().strip()
+        if question_lower in self.engine.greetings:
+            return "greeting"
+        return "conversation" if self.engine._scan_question(question_lower)["conversation"] else "document"
+
+    def output(self, answer, docs):
+        answer_lower = answer.lower().strip()
+        if self.engine.find_general_knowledge(answer_lower):
+            return False
+        answer_words = set(answer_lower.split())
+        return not (len(answer_words) > 10 and not _has_overlap(answer_words, docs))
+
+    def strip_hedging(self, answer):
+        return self.engine.strip_hedging(answer)
+
+def make_inputs(rules, n, seed=0):
+    rng = random.Random(seed)
+    questions, answers = [], []
+    for _ in range(n):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(5, 20))]
+        if rng.random() < 0.1:
+            words.insert(rng.randint(0, len(words)), rng.choice(rules["harmful_terms"]))
+        if rng.random() < 0.1:
+            words.insert(0, "what did you say about")
+        if rng.random() < 0.1:
+            words.insert(rng.randint(0, len(words)), rng.choice(OVERLAPPING_FRAGMENTS))
+        questions.append("What about the " + " ".join(words) + "?")
+        answer = [rng.choice(_WORDS) for _ in range(rng.randint(30, 120))]
+        if rng.random() < 0.1:
+            answer.insert(rng.randint(0, len(answer)), rng.choice(rules["general_knowledge_indicators"]))
+        if rng.random() < 0.3:
+            answer.insert(0, rng.choice(rules["hedging_phrases"]).strip())
+        answers.append(" ".join(answer))
+    docs = [SimpleNamespace(page_content=" ".join(rng.choice(_WORDS) for _ in range(200))) for _ in range(4)]
+    return questions, answers, docs
+
+def time_per_call(func, inputs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            func(item)
+    return (time.perf_counter() - start) / (repeat * len(inputs)) * 1e6
+
+def bench(n_rules, n_inputs, repeat):
+    rules = make_rules(n_rules)
+    questions, answers, docs = make_inputs(rules, n_inputs)
+    implementations = {"loops": LoopGuardrails(rules), "engine": EngineGuardrails(rules)}
+
+    # Same decisions from both implementations
+    loops, engine = implementations["loops"], implementations["engine"]
+    for question in questions + OVERLAPPING_FRAGMENTS:
+        assert (loops.safety(question) is None) == (engine.safety(question) is None), question
+        assert loops.classify(question) == engine.classify(question), question
+    for answer in answers:
+        assert loops.output(answer, docs) == engine.output(answer, docs), answer
+
+    result = {"rules_per_set": sum(len(values) for values in rules.values()) // len(rules)}
+    for name, impl in implementations.items():
+        result[name] = {
+            "safety_us": round(time_per_call(impl.safety, questions, repeat), 2),
+            "classify_us": round(time_per_call(impl.classify, questions, repeat), 2),
+            "output_us": round(time_per_call(lambda answer: impl.output(answer, docs), answers, repeat), 2),
+            "strip_hedging_us": round(time_per_call(impl.strip_hedging, answers, repeat), 2),
+        }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark guardrail checks as rule lists grow")
+    parser.add_argument("--rules", default="0,100,500", help="Synthetic rules added to each rule set")
+    parser.add_argument("--inputs", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {"results": [bench(int(n), args.inputs, args.repeat) for n in args.rules.split(",")]}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
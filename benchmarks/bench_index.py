@@ -0,0 +1,82 @@
+# benchmarks/bench_index.py
+# Recall / latency / size trade-offs of the FAISS index types in src/vector_store.py
+#
+#   python benchmarks/bench_index.py --chunks 50000 --dim 384
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MAX_CHUNK_SIZE", "1000")
+os.environ.setdefault("CHUNK_OVERLAP", "200")
+
+from src.vector_store import INDEX_TYPES, build_faiss_index
+
+def make_corpus(n_vectors, dim, n_queries, seed=0):
+    """Clustered synthetic embeddings - closer to real text embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n_vectors // 100, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n_vectors + n_queries)
+    points = centers[labels] + 0.3 * rng.normal(size=(n_vectors + n_queries, dim)).astype(np.float32)
+    return points[:n_vectors], points[n_vectors:]
+
+def bench_index_type(index_type, corpus, queries, ground_truth, k):
+    start = time.perf_counter()
+    index = build_faiss_index(corpus, index_type)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    hits = 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(ids[0]) & set(ground_truth[i]))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "index_type": index_type,
+        "build_seconds": round(build_seconds, 3),
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+        "size_mb": round(faiss.serialize_index(index).nbytes / 1e6, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types on synthetic embeddings")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    corpus, queries = make_corpus(args.chunks, args.dim, args.queries)
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    _, ground_truth = exact.search(queries, args.k)
+
+    report = {
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "k": args.k,
+        "results": [
+            bench_index_type(index_type, corpus, queries, ground_truth, args.k)
+            for index_type in args.types.split(",")
+        ],
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
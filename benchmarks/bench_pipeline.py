@@ -0,0 +1,287 @@
+# benchmarks/bench_pipeline.py
+# Offline end-to-end benchmark: synthetic PDFs -> extraction -> OCR -> chunking ->
+# embedding -> index build -> retrieval -> (rerank) -> generation (stub LLM) -> output validation
+#
+#   python benchmarks/bench_pipeline.py --pages 10,50 --output report.json
+#   python benchmarks/bench_pipeline.py --baseline report.json   # compare against an earlier run
+#
+# Nothing leaves the machine: Groq is replaced by StubLLM and, unless --real-embeddings
+# is given, the embedding model by deterministic HashEmbeddings.
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("MAX_CHUNK_SIZE", "1000")
+os.environ.setdefault("CHUNK_OVERLAP", "200")
+
+from langchain.embeddings.base import Embeddings
+from src.config import settings
+from src.context_packer import count_tokens
+from src.guardrail import validate_output_quality
+from src.lexical_index import build_lexical_index
+from src.pdf_parser import extract_text_from_pdf, extract_text_with_ocr, iter_pdf_pages
+from src.qa_chain import build_conversational_qa_chain
+from src.vector_store import build_faiss_index, build_faiss_incrementally, iter_embedded_batches, iter_page_chunks
+
+_WORDS = (
+    "system pump valve pressure sensor module controller firmware revision clause "
+    "warranty supplier invoice delivery schedule maintenance inspection report torque "
+    "voltage current battery housing assembly tolerance specification compliance audit"
+).split()
+
+def make_page_text(rng, page_number, paragraphs=6):
+    """A page of pseudo-technical prose with ids the retrieval queries can target"""
+    lines = [f"Section {page_number}. Part number AB-{page_number:04d} rev {page_number % 7}."]
+    for _ in range(paragraphs):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(40, 70))]
+        lines.append(" ".join(words).capitalize() + ".")
+    return "\n\n".join(lines)
+
+def make_text_pdf(path, n_pages, seed=0):
+    rng = random.Random(seed)
+    with fitz.open() as doc:
+        for page_number in range(1, n_pages + 1):
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), make_page_text(rng, page_number), fontsize=9)
+        doc.save(path)
+
+def make_scanned_pdf(path, n_pages, seed=0, dpi=150):
+    """Same content as make_text_pdf, but each page is a raster image with no text layer"""
+    with fitz.open() as source, fitz.open() as scanned:
+        rng = random.Random(seed)
+        for page_number in range(1, n_pages + 1):
+            page = source.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), make_page_text(rng, page_number), fontsize=9)
+            pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            target = scanned.new_page(width=page.rect.width, height=page.rect.height)
+            target.insert_image(target.rect, pixmap=pixmap)
+        scanned.save(path)
+
+def make_questions(n_pages, n_questions, seed=0):
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(n_questions):
+        page_number = rng.randint(1, n_pages)
+        if rng.random() < 0.5:
+            questions.append(f"What does part AB-{page_number:04d} say about the {rng.choice(_WORDS)}?")
+        else:
+            questions.append(f"Explain the {rng.choice(_WORDS)} {rng.choice(_WORDS)} requirements.")
+    return questions
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words hashing embeddings: no model download, stable across runs"""
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+class StubLLM:
+    """Stands in for GroqLLM: answers from the prompt's context after a fixed delay"""
+    def __init__(self, latency_ms=0.0, tokens=60):
+        self.latency = latency_ms / 1000
+        self.tokens = tokens
+
+    def _answer(self, prompt):
+        # Echo the start of the retrieved context (see QA_TEMPLATE) so output validation has overlap
+        context = prompt.split("Document context", 1)[-1]
+        words = context.split()[:self.tokens]
+        return "According to the document, " + " ".join(words)
+
+    def __call__(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(prompt)
+
+    def stream(self, prompt):
+        words = self.__call__(prompt).split(" ")
+        for i, word in enumerate(words):
+            yield word if i == 0 else " " + word
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class StageTimer:
+    """Collects per-call latencies and item counts for each named stage"""
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, stage, func, *args, items=1, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        entry = self.stages.setdefault(stage, {"latencies": [], "items": 0})
+        entry["latencies"].append(elapsed)
+        entry["items"] += items(result) if callable(items) else items
+        return result
+
+    def report(self):
+        report = {}
+        for stage, entry in self.stages.items():
+            latencies_ms = np.array(entry["latencies"]) * 1000
+            total_seconds = float(latencies_ms.sum()) / 1000
+            report[stage] = {
+                "calls": len(latencies_ms),
+                "items": entry["items"],
+                "total_seconds": round(total_seconds, 4),
+                "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+                "throughput_per_s": round(entry["items"] / total_seconds, 2) if total_seconds else None,
+            }
+        return report
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_document(timer, workdir, n_pages, args, embed, llm):
+    text_pdf = os.path.join(workdir, f"text-{n_pages}.pdf")
+    scanned_pdf = os.path.join(workdir, f"scanned-{n_pages}.pdf")
+    make_text_pdf(text_pdf, n_pages, seed=n_pages)
+
+    timer.time("extract_text_from_pdf", extract_text_from_pdf, text_pdf, items=n_pages)
+    if not args.skip_ocr:
+        ocr_pages = min(n_pages, args.ocr_pages)
+        make_scanned_pdf(scanned_pdf, ocr_pages, seed=n_pages)
+        timer.time("extract_text_with_ocr", extract_text_with_ocr, scanned_pdf, items=ocr_pages)
+
+    pages = list(iter_pdf_pages(text_pdf))
+    docs = timer.time("chunking", lambda: list(iter_page_chunks(pages, {"source": "bench.pdf"})), items=len)
+    if not docs:
+        raise RuntimeError(f"No chunks extracted from {text_pdf}")
+
+    vectors = timer.time(
+        "embedding",
+        lambda: np.vstack([np.asarray(vecs, dtype=np.float32) for _, vecs in iter_embedded_batches(docs, embed)]),
+        items=len(docs)
+    )
+    timer.time("index_build", build_faiss_index, vectors, items=len(docs))
+
+    # The store the chain searches, built the way ingestion builds it
+    vectorstore = build_faiss_incrementally(docs, embed=embed)
+    if settings.HYBRID_RETRIEVAL:
+        timer.time("lexical_index_build", build_lexical_index, vectorstore, items=len(docs))
+
+    chain = build_conversational_qa_chain(vectorstore, llm)
+    questions = make_questions(n_pages, args.questions, seed=n_pages)
+    rerank_tokens = {"retrieved": 0, "reranked": 0}
+    for question in questions:
+        candidates = timer.time("retrieval", chain.retriever.get_relevant_documents, question)
+        if chain.reranker is not None:
+            reranked = timer.time("rerank", chain._rerank, question, candidates, items=len(candidates))
+            rerank_tokens["retrieved"] += sum(count_tokens(doc.page_content) for doc in candidates[:settings.RETRIEVAL_K])
+            rerank_tokens["reranked"] += sum(count_tokens(doc.page_content) for doc in reranked)
+        result = timer.time("qa_chain", chain, {"question": question})
+        timer.time(
+            "validate_output_quality", validate_output_quality,
+            result["answer"], result["source_documents"], question, result["question_type"]
+        )
+    # Same questions in one call: shared embedding/search, concurrent LLM calls
+    timer.time("qa_batch", chain.batch, questions, items=len(questions))
+    summary = {"pages": n_pages, "chunks": len(docs)}
+    if chain.reranker is not None:
+        summary["rerank_context_tokens"] = rerank_tokens
+    return summary
+
+def compare(report, baseline, max_regression):
+    """Print p50 deltas against a previous report; return the stages that regressed"""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous["p50_ms"]:
+            continue
+        change = current["p50_ms"] / previous["p50_ms"] - 1
+        print(f"{stage:>24}: p50 {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms ({change:+.1%})", file=sys.stderr)
+        if change > max_regression:
+            regressions.append(stage)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest and answer pipeline on synthetic PDFs")
+    parser.add_argument("--pages", default="5,25,100", help="Comma-separated page counts, one document each")
+    parser.add_argument("--ocr-pages", type=int, default=3, help="Scanned pages per document (OCR is slow)")
+    parser.add_argument("--skip-ocr", action="store_true")
+    parser.add_argument("--questions", type=int, default=20, help="Questions asked per document")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated LLM latency")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use EMBEDDING_MODEL instead of hash embeddings")
+    parser.add_argument("--rerank", action="store_true", help="Rerank candidates with RERANK_MODEL (downloads the model)")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p50 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.real_embeddings:
+        from src.embeddings import get_embeddings_client
+        embed = get_embeddings_client()
+    else:
+        embed = HashEmbeddings()
+    if args.rerank:
+        settings.RERANK_ENABLED = True
+    llm = StubLLM(latency_ms=args.llm_latency_ms)
+    timer = StageTimer()
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as workdir:
+        documents = [
+            bench_document(timer, workdir, int(n_pages), args, embed, llm)
+            for n_pages in args.pages.split(",")
+        ]
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "embeddings": settings.EMBEDDING_MODEL if args.real_embeddings else "hash",
+        "reranker": settings.RERANK_MODEL if args.rerank else None,
+        "chunk_size": settings.MAX_CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "documents": documents,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.report(),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressed: " + ", ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
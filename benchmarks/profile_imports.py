@@ -0,0 +1,118 @@
+# benchmarks/profile_imports.py
+# Import-time profile of the modules app.py and api.py load at startup, plus the warm-up phase
+#
+#   python benchmarks/profile_imports.py                     # report, exit 1 on a regression
+#   python benchmarks/profile_imports.py --warm-up --output imports.json
+#
+# Each measurement runs in a fresh interpreter (python -X importtime), so module caches
+# from earlier runs cannot hide a regression.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What app.py / api.py import from src at startup
+STARTUP_MODULES = [
+    "src.config", "src.metrics", "src.vector_store", "src.qa_chain", "src.guardrail",
+    "src.memory_store", "src.memory_backend", "src.index_cache", "src.ingest_jobs", "src.warmup",
+]
+
+# Deferred until first use; importing any of these at startup is a regression
+DEFERRED_MODULES = [
+    "torch", "sentence_transformers", "langchain_huggingface", "paddleocr", "paddle",
+    "fitz", "faiss", "langchain_community.vectorstores.faiss",
+    "langchain.text_splitter", "langchain.prompts", "groq", "redis",
+]
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("MAX_CHUNK_SIZE", "1000")
+    env.setdefault("CHUNK_OVERLAP", "200")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+def profile_imports(modules):
+    """
+    Import modules in a fresh interpreter under -X importtime
+    Returns (total seconds, {module: cumulative seconds}) for every module imported
+    """
+    code = "import " + ", ".join(modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=_env(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # header line
+        seconds = int(cumulative_us) / 1e6
+        cumulative[name.strip()] = seconds
+        if not name.startswith("  "):
+            total += seconds  # top-level entries add up to the whole import
+    return total, cumulative
+
+def profile_warm_up():
+    """Stage timings of src.warmup run to completion in a fresh interpreter"""
+    code = (
+        "import json; from src.warmup import start_warm_up; "
+        "run = start_warm_up(); run.wait(); print(json.dumps(run.describe()))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Warm-up failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile startup import time and the warm-up phase")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement (best is kept)")
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="Fail if importing the startup modules takes longer")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules listed in the report")
+    parser.add_argument("--warm-up", action="store_true", help="Also time the background warm-up stages")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    runs = [profile_imports(STARTUP_MODULES) for _ in range(args.repeat)]
+    total, cumulative = min(runs, key=lambda run: run[0])
+    eager = sorted(name for name in DEFERRED_MODULES if name in cumulative)
+
+    report = {
+        "python": sys.version.split()[0],
+        "startup_import_seconds": round(total, 3),
+        "per_module_seconds": {name: round(cumulative.get(name, 0.0), 3) for name in STARTUP_MODULES},
+        "slowest": [
+            {"module": name, "seconds": round(seconds, 3)}
+            for name, seconds in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]
+        ],
+        "eagerly_imported": eager,
+    }
+    if args.warm_up:
+        report["warm_up"] = profile_warm_up()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+    failures = []
+    if eager:
+        failures.append("imported at startup: " + ", ".join(eager))
+    if total > args.max_seconds:
+        failures.append(f"startup imports took {total:.2f}s (limit {args.max_seconds:.2f}s)")
+    if failures:
+        print("Regressed: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
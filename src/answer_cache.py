@@ -0,0 +1,125 @@
+# src/answer_cache.py
+# Process-wide semantic cache of answers, keyed by document + question embedding
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+from src.config import settings
+
+class SemanticAnswerCache:
+    """
+    Stores answers per document key and returns one when a new question's
+    embedding is within `threshold` cosine similarity of a cached question
+    Entries expire after ttl_seconds; the least recently used are evicted past max_entries
+    """
+    def __init__(self, threshold=0.92, ttl_seconds=3600, max_entries=5000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # (doc_key, entry_id) -> entry, oldest first
+        self._by_doc = {}  # doc_key -> {"ids": [...], "matrix": ndarray or None}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _drop(self, doc_key, entry_id):
+        self._lru.pop((doc_key, entry_id), None)
+        doc = self._by_doc.get(doc_key)
+        if doc and entry_id in doc["ids"]:
+            doc["ids"].remove(entry_id)
+            doc["matrix"] = None
+            if not doc["ids"]:
+                del self._by_doc[doc_key]
+
+    def _matrix(self, doc_key):
+        doc = self._by_doc[doc_key]
+        if doc["matrix"] is None:
+            doc["matrix"] = np.stack([self._lru[(doc_key, entry_id)]["vector"] for entry_id in doc["ids"]])
+        return doc["matrix"]
+
+    def lookup(self, doc_key, query_vector):
+        """Return the best cached entry above the threshold, or None"""
+        with self._lock:
+            doc = self._by_doc.get(doc_key)
+            if not doc:
+                self.misses += 1
+                return None
+
+            # Expire stale entries for this document first
+            now = time.time()
+            for entry_id in list(doc["ids"]):
+                if now - self._lru[(doc_key, entry_id)]["created"] > self.ttl_seconds:
+                    self._drop(doc_key, entry_id)
+            if doc_key not in self._by_doc:
+                self.misses += 1
+                return None
+
+            scores = self._matrix(doc_key) @ self._normalize(query_vector)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._by_doc[doc_key]["ids"][best]
+            self._lru.move_to_end((doc_key, entry_id))
+            self.hits += 1
+            entry = self._lru[(doc_key, entry_id)]
+            return dict(entry, similarity=float(scores[best]))
+
+    def store(self, doc_key, question, query_vector, answer, source_documents):
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._lru[(doc_key, entry_id)] = {
+                "question": question,
+                "vector": self._normalize(query_vector),
+                "answer": answer,
+                "source_documents": list(source_documents),
+                "created": time.time(),
+            }
+            doc = self._by_doc.setdefault(doc_key, {"ids": [], "matrix": None})
+            doc["ids"].append(entry_id)
+            doc["matrix"] = None
+
+            while len(self._lru) > self.max_entries:
+                oldest_doc, oldest_id = next(iter(self._lru))
+                self._drop(oldest_doc, oldest_id)
+
+    def clear(self, doc_key=None):
+        with self._lock:
+            for key in [k for k in self._lru if doc_key is None or k[0] == doc_key]:
+                self._drop(*key)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._lru),
+                "documents": len(self._by_doc),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """Shared cache for this process, or None when ANSWER_CACHE_ENABLED is off"""
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                threshold=settings.ANSWER_CACHE_THRESHOLD,
+                ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES
+            )
+        return _answer_cache
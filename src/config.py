@@ -5,10 +5,101 @@ load_dotenv()
 class Settings:
     GROQ_API_KEY = os.getenv("GROQ_API_KEY",None)
     MODEL_NAME = os.getenv("MODEL_NAME", None)
+    STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "true").lower() == "true"
+    # Shared Groq HTTP connection pool
+    GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+    GROQ_KEEPALIVE_SECONDS = float(os.getenv("GROQ_KEEPALIVE_SECONDS", "60"))
+    GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "60"))
+    # Retries for rate limits (429), timeouts and 5xx: exponential backoff with jitter, honours Retry-After
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+    LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+    # Concurrent LLM calls per batch of questions (ConversationalQAChain.batch)
+    QA_BATCH_MAX_IN_FLIGHT = int(os.getenv("QA_BATCH_MAX_IN_FLIGHT", "8"))
     PERSIST_DIR = os.getenv("PERSIST_DIR", "./data/faiss_index")
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./data/uploads")
+    # Uploads are parsed from memory; set to keep a copy as UPLOAD_DIR/<content key>.pdf
+    KEEP_UPLOADS = os.getenv("KEEP_UPLOADS", "false").lower() == "true"
     MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", None))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", None))
     EMBEDDING_MODEL =os.getenv("EMBEDDING_MODEL",None)
+    # Embedding pipeline: chunks per embed call, concurrent batches, torch intra-op threads (0 = torch default)
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+    EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+    # Retrieval: chunks passed to the LLM; hybrid = BM25 + dense fused with reciprocal-rank fusion
+    RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+    HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+    HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))  # candidates taken from each ranking
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+    # Cross-encoder reranking: RERANK_CANDIDATES retrieved, scored in batches, at most RETRIEVAL_K kept;
+    # stops scoring / drops chunks more than RERANK_SCORE_GAP (model logits) below the best
+    RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+    RERANK_SCORE_GAP = float(os.getenv("RERANK_SCORE_GAP", "4.0"))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+    # FAISS index type: auto | flat | hnsw | hnsw_sq | ivf_flat | ivf_pq | ivf_sq
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+    FAISS_HNSW_MIN_CHUNKS = int(os.getenv("FAISS_HNSW_MIN_CHUNKS", "10000"))  # auto: flat below this
+    FAISS_IVF_MIN_CHUNKS = int(os.getenv("FAISS_IVF_MIN_CHUNKS", "200000"))  # auto: IVF-SQ8 from here up
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+    FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))  # 0 = ~4*sqrt(chunks)
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+    # Semantic answer cache: reuse answers to near-identical questions on the same document
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+    ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+    # Background ingestion: concurrent jobs and how many may wait in the queue
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+    INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "20"))
+    # Content-addressed FAISS index cache (shared across sessions)
+    INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", os.path.join(PERSIST_DIR, "index_cache"))
+    INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "2048"))
+    # Streaming OCR: worker processes, pages rasterized/in flight at once, render DPI
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+    OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+    OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+    OCR_LANGS = os.getenv("OCR_LANGS", "en")  # comma-separated PaddleOCR language codes
+    OCR_WARM_START = os.getenv("OCR_WARM_START", "false").lower() == "true"
+    # Per-page classification: pages below this many text-layer chars and at or above this image coverage get OCR'd
+    OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+    OCR_MIN_IMAGE_COVERAGE = float(os.getenv("OCR_MIN_IMAGE_COVERAGE", "0.3"))
+    # Instrumentation (src/metrics.py): exporters = comma-separated log | prometheus | otel
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_EXPORTERS = os.getenv("METRICS_EXPORTERS", "log")
+    METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "./data/metrics/qabot.prom")
+    METRICS_PROMETHEUS_INTERVAL = float(os.getenv("METRICS_PROMETHEUS_INTERVAL", "15"))
+    # HTTP API (api.py): bind address, worker processes, backpressure and session limits
+    API_HOST = os.getenv("API_HOST", "0.0.0.0")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+    API_MAX_CONCURRENT_QUESTIONS = int(os.getenv("API_MAX_CONCURRENT_QUESTIONS", "256"))  # per worker
+    API_QUEUE_TIMEOUT_SECONDS = float(os.getenv("API_QUEUE_TIMEOUT_SECONDS", "5"))  # wait for a slot, then 503
+    API_SESSION_TTL_SECONDS = int(os.getenv("API_SESSION_TTL_SECONDS", "3600"))
+    API_MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "1000"))
+    API_MAX_UPLOAD_MB = int(os.getenv("API_MAX_UPLOAD_MB", "50"))
+    API_MAX_BATCH_QUESTIONS = int(os.getenv("API_MAX_BATCH_QUESTIONS", "100"))
+    # Prompt budget (tokens counted with tiktoken): whole prompt, and the history's share of it
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+    TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+    # Conversation memory: window drops old exchanges, summary folds them into a rolling summary
+    MEMORY_MODE = os.getenv("MEMORY_MODE", "window")
+    MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "10"))
+    MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1000"))
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+    # Where API session memory lives: local (in-process) | sqlite (one file per host) | redis (shared)
+    MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "local")
+    MEMORY_SQLITE_PATH = os.getenv("MEMORY_SQLITE_PATH", "./data/memory/memory.sqlite3")
+    MEMORY_REDIS_URL = os.getenv("MEMORY_REDIS_URL", "redis://localhost:6379/0")
+    MEMORY_TTL_SECONDS = int(os.getenv("MEMORY_TTL_SECONDS", "86400"))  # idle sessions expire
+    MEMORY_STORE_MAX_MESSAGES = int(os.getenv("MEMORY_STORE_MAX_MESSAGES", "200"))  # cap per session
+    # Extra guardrail rules (JSON, see guardrail.load_rules); empty = built-in rules only
+    GUARDRAIL_RULES_FILE = os.getenv("GUARDRAIL_RULES_FILE", "")
 
 settings = Settings()
@@ -0,0 +1,151 @@
+# src/context_packer.py
+# Fits retrieved chunks and conversation history into a prompt token budget
+import logging
+import threading
+from langchain.docstore.document import Document
+from src.config import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger("qabot.context")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+def _get_encoding():
+    """tiktoken encoding for TOKENIZER_ENCODING, or None (offline / not installed)"""
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                # First use downloads the BPE file unless it is already in TIKTOKEN_CACHE_DIR
+                _encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+            except Exception as e:
+                _encoding_failed = True
+                logger.warning("Tokenizer %s unavailable (%s); estimating 4 characters per token",
+                               settings.TOKENIZER_ENCODING, e if tiktoken else "tiktoken not installed")
+    return _encoding
+
+def count_tokens(text):
+    """Token count of text with the configured tokenizer"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest prefix of text that fits in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+def _span_key(doc):
+    metadata = doc.metadata
+    start, end = metadata.get("start_index", -1), metadata.get("end_index", -1)
+    if start is None or end is None or start < 0 or end < 0:
+        return None
+    return (metadata.get("source_id", metadata.get("source")), metadata.get("page")), start, end
+
+def dedupe_chunks(docs):
+    """
+    Drop repeated chunks and merge chunks that overlap on the same page
+    (splitter overlap makes neighbouring chunks share CHUNK_OVERLAP characters)
+    A merged chunk takes the rank of its best-ranked part
+    """
+    ranked = []  # (rank, Document)
+    by_page = {}  # page key -> [(start, end, rank, doc)]
+    for rank, doc in enumerate(docs):
+        key = _span_key(doc)
+        if key is None:
+            ranked.append((rank, doc))
+        else:
+            page_key, start, end = key
+            by_page.setdefault(page_key, []).append((start, end, rank, doc))
+
+    for spans in by_page.values():
+        spans.sort(key=lambda span: span[:2])
+        start, end, rank, doc = spans[0]
+        text = doc.page_content
+        for next_start, next_end, next_rank, next_doc in spans[1:]:
+            if next_start <= end:
+                # Offsets are page positions, so the tail past `end` is the new text
+                if next_end > end:
+                    text += next_doc.page_content[end - next_start:]
+                    end = next_end
+                if next_rank < rank:
+                    rank, doc = next_rank, next_doc
+                continue
+            ranked.append((rank, Document(page_content=text, metadata=dict(doc.metadata, start_index=start, end_index=end))))
+            start, end, rank, doc = next_start, next_end, next_rank, next_doc
+            text = doc.page_content
+        ranked.append((rank, Document(page_content=text, metadata=dict(doc.metadata, start_index=start, end_index=end))))
+
+    ranked.sort(key=lambda item: item[0])
+    unique, seen = [], set()
+    for _, doc in ranked:
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            unique.append(doc)
+    return unique
+
+def pack_chunks(docs, max_tokens):
+    """
+    Best-ranked chunks that fit in max_tokens, in rank order
+    A chunk too big for the space left is skipped for smaller lower-ranked ones;
+    if not even the top chunk fits, it is truncated so the prompt is never empty
+    Returns (packed docs, tokens used)
+    """
+    packed, used = [], 0
+    for doc in docs:
+        # +2 for the blank line joining chunks
+        tokens = count_tokens(doc.page_content) + 2
+        if used + tokens <= max_tokens:
+            packed.append(doc)
+            used += tokens
+    if not packed and docs and max_tokens > 0:
+        text = truncate_to_tokens(docs[0].page_content, max_tokens)
+        packed, used = [Document(page_content=text, metadata=docs[0].metadata)], count_tokens(text)
+    return packed, used
+
+def format_history(messages, max_tokens, summary=""):
+    """
+    "human: ..."/"ai: ..." lines for the newest messages that fit in max_tokens,
+    preceded by the rolling summary of older turns when there is one
+    """
+    lines = []
+    for msg in messages:
+        line = f"{msg.type}: {msg.content}"
+        lines.append((line, count_tokens(line) + 1))
+    return format_history_lines(lines, max_tokens, summary)
+
+def format_history_lines(lines, max_tokens, summary=""):
+    """format_history over already formatted (line, tokens) pairs, e.g. SessionMemory's cache"""
+    selected = []
+    used = 0
+    if summary:
+        summary_line = f"summary of earlier conversation: {summary}"
+        used = count_tokens(summary_line)
+        if used > max_tokens:
+            summary_line = truncate_to_tokens(summary_line, max_tokens)
+            used = max_tokens
+    for line, tokens in reversed(lines):
+        if used + tokens > max_tokens:
+            break
+        selected.append(line)
+        used += tokens
+    selected.reverse()
+    if summary:
+        selected.insert(0, summary_line)
+    return "\n".join(selected)
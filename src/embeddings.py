@@ -1,5 +1,85 @@
-from langchain_huggingface  import HuggingFaceEmbeddings
+import os
+import threading
+import time
 from src.config import settings
 
-def get_embeddings_client():
-    return HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+# Process-wide registry: one loaded model per model name, shared by every session
+_models = {}
+_model_metrics = {}
+_registry_lock = threading.Lock()
+_model_locks = {}
+
+def _current_rss_bytes():
+    """Resident set size of this process in bytes (0 if unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        try:
+            import resource
+            # ru_maxrss is KiB on Linux, bytes on macOS - good enough as a fallback
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+def _get_model_lock(model_name):
+    with _registry_lock:
+        if model_name not in _model_locks:
+            _model_locks[model_name] = threading.Lock()
+        return _model_locks[model_name]
+
+def get_embeddings_client(model_name=None):
+    """
+    Return the shared embeddings model for model_name (default: settings.EMBEDDING_MODEL)
+    The model is loaded once per process; later calls return the same instance
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL
+
+    model = _models.get(model_name)
+    if model is not None:
+        _model_metrics[model_name]["hits"] += 1
+        return model
+
+    # Per-model lock so two sessions uploading at once don't both load the weights
+    with _get_model_lock(model_name):
+        model = _models.get(model_name)
+        if model is not None:
+            _model_metrics[model_name]["hits"] += 1
+            return model
+
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        # Pulls in torch and sentence-transformers, so only imported when a model is first needed
+        from langchain_huggingface import HuggingFaceEmbeddings
+        model = HuggingFaceEmbeddings(model_name=model_name)
+        load_seconds = time.perf_counter() - start
+        rss_after = _current_rss_bytes()
+
+        _model_metrics[model_name] = {
+            "load_seconds": load_seconds,
+            "rss_delta_bytes": max(rss_after - rss_before, 0),
+            "loaded_at": time.time(),
+            "hits": 0,
+        }
+        _models[model_name] = model
+        return model
+
+def warm_up_embeddings(model_names=None, status_callback=None):
+    """Load the given embedding models (default: the configured one) ahead of the first upload"""
+    model_names = model_names or [settings.EMBEDDING_MODEL]
+    for model_name in model_names:
+        if status_callback:
+            status_callback(f" Loading embedding model {model_name}...")
+        get_embeddings_client(model_name)
+        if status_callback:
+            metrics = _model_metrics.get(model_name, {})
+            status_callback(f" Embedding model {model_name} ready in {metrics.get('load_seconds', 0):.2f}s")
+
+def get_embedding_metrics():
+    """Load time, memory delta and reuse count for every model in the registry"""
+    with _registry_lock:
+        return {name: dict(metrics) for name, metrics in _model_metrics.items()}
+
+def is_embedding_model_loaded(model_name=None):
+    """True if the model is already resident in this process"""
+    return (model_name or settings.EMBEDDING_MODEL) in _models
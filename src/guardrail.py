@@ -1,5 +1,11 @@
 # Efficient output-focused guardrail system
+# Rule lists are compiled once into a GuardrailEngine: every check is a single regex pass
+import json
 import re
+import threading
+from functools import lru_cache
+from src.metrics import traced, increment
+from src.config import settings
 
 # Only block truly harmful inputs
 HARMFUL_TERMS = {"hack", "exploit", "illegal", "suicide", "self-harm"}
@@ -9,17 +15,263 @@ HARMFUL_PATTERNS = [
     r"illegal (activities|methods|ways)"
 ]
 
+# Phrases that mark an answer as general knowledge rather than document content
+GENERAL_KNOWLEDGE_INDICATORS = [
+    "based on my general knowledge",
+    "as an ai language model", 
+    "in general,",
+    "typically,",
+    "usually,",
+    "commonly,",
+    "is a programming language",
+    "is defined as",
+    "refers to the",
+    "in computer science"
+]
+
+# Common LLM hedging language removed from answers
+HEDGING_PHRASES = [
+    "I might be wrong, ",
+    "I could be mistaken, ",
+    "Based on my training, ",
+    "As an AI, ",
+    "According to my knowledge, ",
+    "From what I understand, "
+]
+
+# Question classification (used by the QA chain)
+GREETINGS = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
+CONVERSATION_PATTERNS = [
+    r"what was my (last|previous|second last|first) question",
+    r"what did i ask (before|earlier|previously)",
+    r"can you repeat",
+    r"what did you (say|tell me) (about|before)",
+    r"go back to",
+    r"earlier you (said|mentioned)",
+    r"in our conversation",
+    r"you mentioned",
+    r"we were talking about",
+    r"from our chat"
+]
+
+RULE_SETS = {
+    "harmful_terms": HARMFUL_TERMS,
+    "harmful_patterns": HARMFUL_PATTERNS,
+    "general_knowledge_indicators": GENERAL_KNOWLEDGE_INDICATORS,
+    "hedging_phrases": HEDGING_PHRASES,
+    "greetings": GREETINGS,
+    "conversation_patterns": CONVERSATION_PATTERNS,
+}
+
+_WORD_RE = re.compile(r"\S+")
+
+def literal_alternation(phrases):
+    """
+    Regex matching any of the literal phrases, factored into a trie
+    ("hack|help" -> "h(?:ack|elp)") so matching cost stays flat as the list grows
+    """
+    phrases = [phrase for phrase in phrases if phrase]
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of phrase
+
+    def to_regex(node):
+        if list(node) == [""]:
+            return ""
+        optional = "" in node
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = "(?:" + body + ")?" if len(branches) > 1 or len(branches[0]) > 1 else body + "?"
+        return body
+
+    return to_regex(trie) if phrases else r"(?!)"
+
+_META = set(".^$*+?{}[]\\|()")
+_BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+def _has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+def literal_prefix(pattern):
+    """Literal text every match of pattern must start with ("" if there is none)"""
+    if _has_top_level_alternation(pattern):
+        return ""
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break  # \d, \b, ... are not literals
+            literal, step = pattern[i + 1], 2
+        elif char in _META:
+            break
+        else:
+            literal, step = char, 1
+        following = pattern[i + step:i + step + 1]
+        if following and following in "*?{":
+            break  # optional or repeated
+        prefix.append(literal)
+        if following == "+":
+            break
+        i += step
+    return "".join(prefix)
+
+class MultiPatternMatcher:
+    """
+    Which of many labelled regexes occur in a text, found with one scan
+    A trie regex over the rules' literal prefixes finds candidate positions
+    (Aho-Corasick style), and only rules sharing that prefix are tried there.
+    Rules without a literal prefix are searched per label, one combined regex each
+    (rules with backreferences on their own, since combining renumbers groups).
+    """
+    def __init__(self, rules):
+        by_prefix = {}
+        fallback = []
+        for label, pattern in rules:
+            prefix = literal_prefix(pattern)
+            if prefix:
+                by_prefix.setdefault(prefix, []).append((label, re.compile(pattern)))
+            else:
+                fallback.append((label, pattern))
+        
+        # The trie regex reports the longest prefix at a position; shorter ones apply there too
+        self._candidates = {
+            prefix: [rule for end in range(1, len(prefix) + 1) for rule in by_prefix.get(prefix[:end], ())]
+            for prefix in by_prefix
+        }
+        self._prefix_re = re.compile(literal_alternation(list(by_prefix)))
+        self._fallback = []  # (label, compiled regex)
+        for label in dict.fromkeys(label for label, _ in fallback):
+            patterns = [pattern for rule_label, pattern in fallback if rule_label == label]
+            combinable = [pattern for pattern in patterns if not _BACKREFERENCE_RE.search(pattern)]
+            try:
+                # A search finds a match if any alternative matches anywhere, so one
+                # combined regex per label cannot hide another label's match
+                combined = [re.compile("|".join(f"(?:{pattern})" for pattern in combinable))] if combinable else []
+            except re.error:
+                combined = [re.compile(pattern) for pattern in combinable]  # e.g. inline global flags
+            self._fallback += [(label, rule) for rule in combined]
+            self._fallback += [(label, re.compile(pattern)) for pattern in patterns if pattern not in combinable]
+
+    def scan(self, text):
+        """Set of labels with at least one match in text"""
+        found = set()
+        search = self._prefix_re.search
+        match = search(text)
+        while match:
+            position = match.start()
+            for label, rule in self._candidates[match.group()]:
+                if label not in found and rule.match(text, position):
+                    found.add(label)
+            match = search(text, position + 1)
+        for label, rule in self._fallback:
+            if label not in found and rule.search(text):
+                found.add(label)
+        return found
+
+class GuardrailEngine:
+    """
+    Compiled guardrail rules
+    Questions: one pass classifies harmful terms/patterns and conversation questions.
+    Answers: one pass for general-knowledge indicators, one for hedging removal.
+    """
+    def __init__(self, rules=None):
+        rules = dict(RULE_SETS, **(rules or {}))
+        self.greetings = frozenset(phrase.lower() for phrase in rules["greetings"])
+        self._question_matcher = MultiPatternMatcher(
+            [("harmful_term", re.escape(term.lower())) for term in rules["harmful_terms"]]
+            + [("harmful_pattern", pattern) for pattern in rules["harmful_patterns"]]
+            + [("conversation", pattern) for pattern in rules["conversation_patterns"]]
+        )
+        indicators = [indicator.lower() for indicator in rules["general_knowledge_indicators"]]
+        self._indicator_re = re.compile(literal_alternation(indicators))
+        self.max_indicator_length = max((len(indicator) for indicator in indicators), default=0)
+        self._hedging_re = re.compile(literal_alternation(rules["hedging_phrases"]))
+        # validate_safety and the chain both scan the same question
+        self.scan_question = lru_cache(maxsize=1024)(self._scan_question)
+
+    def _scan_question(self, question_lower):
+        """{"harmful": None | "term" | "pattern", "conversation": bool} for a lowercased question"""
+        found = self._question_matcher.scan(question_lower)
+        # Terms take precedence over patterns, as in the original check order
+        harmful = "term" if "harmful_term" in found else "pattern" if "harmful_pattern" in found else None
+        return {"harmful": harmful, "conversation": "conversation" in found}
+
+    def classify_question(self, question):
+        """ "greeting", "conversation" or "document" """
+        question_lower = question.lower().strip()
+        if question_lower in self.greetings:
+            return "greeting"
+        return "conversation" if self.scan_question(question_lower)["conversation"] else "document"
+
+    def find_general_knowledge(self, text_lower):
+        return self._indicator_re.search(text_lower) is not None
+
+    def strip_hedging(self, text):
+        return self._hedging_re.sub("", text)
+
+def load_rules(path):
+    """
+    Rule sets from a JSON file: {"harmful_terms": [...], "conversation_patterns": [...], ...}
+    Lists extend the built-in rules unless the file sets "replace_defaults": true
+    """
+    with open(path, encoding="utf-8") as f:
+        loaded = json.load(f)
+    unknown = set(loaded) - set(RULE_SETS) - {"replace_defaults"}
+    if unknown:
+        raise ValueError(f"Unknown guardrail rule sets in {path}: {', '.join(sorted(unknown))}")
+    if loaded.get("replace_defaults"):
+        return {name: list(loaded.get(name, [])) for name in RULE_SETS}
+    return {name: list(defaults) + list(loaded.get(name, [])) for name, defaults in RULE_SETS.items()}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_guardrail_engine():
+    """Process-wide engine built from the defaults plus GUARDRAIL_RULES_FILE"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                rules = load_rules(settings.GUARDRAIL_RULES_FILE) if settings.GUARDRAIL_RULES_FILE else None
+                _engine = GuardrailEngine(rules)
+    return _engine
+
+@traced("guardrail.safety")
 def validate_safety(question):
     """Only validate for safety - let everything else through"""
     question_lower = question.lower().strip()
     
     # Block only harmful content
-    if any(term in question_lower for term in HARMFUL_TERMS):
+    harmful = get_guardrail_engine().scan_question(question_lower)["harmful"]
+    if harmful == "term":
         return False, "I can't help with potentially harmful requests."
-    
-    for pattern in HARMFUL_PATTERNS:
-        if re.search(pattern, question_lower):
-            return False, "I can't assist with potentially harmful requests."
+    if harmful == "pattern":
+        return False, "I can't assist with potentially harmful requests."
     
     # Block empty questions
     if len(question.strip()) < 2:
@@ -27,13 +279,24 @@ def validate_safety(question):
     
     return True, None
 
+def _has_overlap(answer_words, source_documents, needed=2):
+    """True once `needed` distinct answer words appear in the first two source chunks"""
+    found = set()
+    for doc in source_documents[:2]:
+        for match in _WORD_RE.finditer(doc.page_content):
+            word = match.group().lower()
+            if word in answer_words and word not in found:
+                found.add(word)
+                if len(found) >= needed:
+                    return True
+    return False
+
+@traced("guardrail.output_quality")
 def validate_output_quality(answer, source_documents, question, question_type="document"):
     """
     Smart output validation based on question type
     Returns (is_valid, processed_answer)
     """
-    answer_lower = answer.lower().strip()
-    
     # For conversation/greeting questions, minimal validation
     if question_type in ["greeting", "conversation"]:
         return True, enforce_output_format(answer)
@@ -44,51 +307,24 @@ def validate_output_quality(answer, source_documents, question, question_type="d
         if not source_documents:
             return False, "I cannot find this information in the uploaded document."
         
-        # Check for obvious general knowledge responses
-        general_knowledge_indicators = [
-            "based on my general knowledge",
-            "as an ai language model", 
-            "in general,",
-            "typically,",
-            "usually,",
-            "commonly,",
-            "is a programming language",
-            "is defined as",
-            "refers to the",
-            "in computer science"
-        ]
+        answer_lower = answer.lower().strip()
         
-        if any(indicator in answer_lower for indicator in general_knowledge_indicators):
+        # Check for obvious general knowledge responses
+        if get_guardrail_engine().find_general_knowledge(answer_lower):
             return False, "I can only answer based on the uploaded document content."
         
         # Simple overlap check - if answer has some connection to source, it's probably valid
-        if source_documents:
-            source_text = " ".join([doc.page_content.lower() for doc in source_documents[:2]])
-            answer_words = set(answer_lower.split())
-            source_words = set(source_text.split())
-            overlap = len(answer_words.intersection(source_words))
-            
-            # Very lenient check - just need some overlap
-            if len(answer_words) > 10 and overlap < 2:
-                return False, "I can only answer based on the uploaded document content."
+        # Very lenient check - just need some overlap; stops scanning at the second shared word
+        answer_words = set(answer_lower.split())
+        if len(answer_words) > 10 and not _has_overlap(answer_words, source_documents):
+            return False, "I can only answer based on the uploaded document content."
     
     return True, enforce_output_format(answer)
 
 def enforce_output_format(answer):
     """Enforce clear and concise output format"""
     # Remove common LLM hedging language
-    hedging_phrases = [
-        "I might be wrong, ",
-        "I could be mistaken, ",
-        "Based on my training, ",
-        "As an AI, ",
-        "According to my knowledge, ",
-        "From what I understand, "
-    ]
-    
-    cleaned_answer = answer
-    for phrase in hedging_phrases:
-        cleaned_answer = cleaned_answer.replace(phrase, "")
+    cleaned_answer = get_guardrail_engine().strip_hedging(answer)
     
     # Ensure answer starts with capital letter
     cleaned_answer = cleaned_answer.strip()
@@ -105,3 +341,44 @@ def enforce_output_format(answer):
         cleaned_answer += "."
     
     return cleaned_answer
+
+class StreamingOutputGuard:
+    """
+    Output guardrails for streamed answers
+    stream() passes chunks through while checking for general-knowledge
+    phrases incrementally (document questions only) and cuts the stream on a
+    hit; finalize() runs the full validate_output_quality on the complete text
+    """
+    def __init__(self, source_documents, question, question_type="document"):
+        self.source_documents = source_documents
+        self.question = question
+        self.question_type = question_type
+        self.blocked = False
+        self._parts = []
+        self._tail = ""
+        self._engine = get_guardrail_engine()
+        self._window = self._engine.max_indicator_length
+    
+    def stream(self, chunks):
+        chunks = iter(chunks)
+        try:
+            for chunk in chunks:
+                self._parts.append(chunk)
+                if self.question_type == "document":
+                    # Only re-scan the new text plus enough of the old to catch a phrase split across chunks
+                    self._tail = (self._tail + chunk.lower())[-(self._window + len(chunk)):]
+                    if self._engine.find_general_knowledge(self._tail):
+                        self.blocked = True
+                        increment("guardrail_stream_blocks")
+                        return
+                yield chunk
+        finally:
+            # Blocked, or the consumer stopped early: stop generation too
+            if hasattr(chunks, "close"):
+                chunks.close()
+    
+    def finalize(self):
+        """Returns (is_valid, processed_answer) for the text seen so far"""
+        if self.blocked:
+            return False, "I can only answer based on the uploaded document content."
+        return validate_output_quality("".join(self._parts), self.source_documents, self.question, self.question_type)
@@ -0,0 +1,150 @@
+# src/index_cache.py
+# Content-addressed cache of built FAISS indexes, shared by all sessions and processes
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from src.lexical_index import get_lexical_index, load_lexical_index, save_lexical_index
+from src.vector_store import MMAP_INDEX_FILE, load_mmap_vectorstore, save_mmap_vectorstore
+from src.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows - eviction falls back to best effort
+    fcntl = None
+
+# Bump when the on-disk entry layout changes so old entries are simply missed
+CACHE_FORMAT = "mmap-v1"
+_LOCK_FILE = ".evict.lock"
+
+def compute_content_hash(data):
+    """SHA-256 of the raw PDF bytes"""
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+def make_index_cache_key(content_hash):
+    """Cache key = PDF content hash + every setting that changes the resulting index"""
+    parts = [
+        content_hash,
+        str(settings.MAX_CHUNK_SIZE),
+        str(settings.CHUNK_OVERLAP),
+        str(settings.EMBEDDING_MODEL),
+        CACHE_FORMAT,
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def combine_cache_keys(cache_keys):
+    """Order-independent key for a set of documents (e.g. the answer cache key of a multi-PDF session)"""
+    if not cache_keys:
+        return None
+    if len(cache_keys) == 1:
+        return next(iter(cache_keys))
+    return hashlib.sha256("|".join(sorted(cache_keys)).encode("utf-8")).hexdigest()
+
+def _entry_dir(cache_key):
+    return os.path.join(settings.INDEX_CACHE_DIR, cache_key)
+
+def load_cached_vectorstore(cache_key, status_callback=None):
+    """
+    Load a cached index for cache_key, or return None on a miss
+    Hits are memory-mapped and shared read-only by every session in the process
+    """
+    entry_dir = _entry_dir(cache_key)
+    if not os.path.exists(os.path.join(entry_dir, MMAP_INDEX_FILE)):
+        return None
+
+    try:
+        db = load_mmap_vectorstore(entry_dir)
+    except Exception as e:
+        # Entry evicted or half-removed by another process - treat as a miss
+        if status_callback:
+            status_callback(f" Index cache entry unreadable ({str(e)}), rebuilding...")
+        return None
+
+    if settings.HYBRID_RETRIEVAL and get_lexical_index(db, build=False) is None:
+        load_lexical_index(db, entry_dir)
+    
+    # Bump mtime so LRU eviction sees this entry as recently used
+    try:
+        os.utime(entry_dir, None)
+    except OSError:
+        pass
+
+    if status_callback:
+        status_callback(" Loaded index from cache")
+    return db
+
+def save_vectorstore_to_cache(cache_key, db):
+    """
+    Persist db under cache_key
+    Writes go to a private temp dir and are renamed into place, so concurrent
+    writers never expose a partial index; the first rename wins
+    """
+    os.makedirs(settings.INDEX_CACHE_DIR, exist_ok=True)
+    entry_dir = _entry_dir(cache_key)
+    if os.path.exists(entry_dir):
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=settings.INDEX_CACHE_DIR)
+    try:
+        save_mmap_vectorstore(db, tmp_dir)
+        save_lexical_index(db, tmp_dir)
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another writer finished first - keep theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    evict_index_cache()
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def evict_index_cache(max_bytes=None):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    if max_bytes is None:
+        max_bytes = settings.INDEX_CACHE_MAX_MB * 1024 * 1024
+    if not os.path.isdir(settings.INDEX_CACHE_DIR):
+        return
+
+    lock_file = open(os.path.join(settings.INDEX_CACHE_DIR, _LOCK_FILE), "w")
+    try:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        entries = []
+        for name in os.listdir(settings.INDEX_CACHE_DIR):
+            if name.startswith("."):
+                continue
+            path = os.path.join(settings.INDEX_CACHE_DIR, name)
+            try:
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            # Rename first so readers never see a partially deleted entry
+            doomed = os.path.join(settings.INDEX_CACHE_DIR, f".evict-{os.path.basename(path)}-{time.time_ns()}")
+            try:
+                os.rename(path, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+    finally:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
@@ -0,0 +1,204 @@
+# src/ingest_jobs.py
+# Background ingestion jobs: bounded worker pool, priority queue, progress and cancellation
+import itertools
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from src.index_cache import load_cached_vectorstore, save_vectorstore_to_cache
+from src.pdf_parser import iter_pdf_pages
+from src.vector_store import create_vectorstore_from_pages
+from src.metrics import span, increment, observe
+from src.config import settings
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class IngestionCancelled(Exception):
+    """Raised from a job's status_callback once the job has been cancelled"""
+
+class IngestionJob:
+    def __init__(self, func, args, kwargs, priority):
+        self.id = uuid.uuid4().hex
+        self.priority = priority
+        self.status = QUEUED
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel_event = threading.Event()
+
+    @property
+    def last_message(self):
+        return self.messages[-1] if self.messages else ""
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def report(self, message):
+        """status_callback for the pipeline; also the cancellation checkpoint"""
+        if self._cancel_event.is_set():
+            raise IngestionCancelled(self.id)
+        self.messages.append(message)
+        # Keep memory bounded on very long documents
+        if len(self.messages) > 200:
+            del self.messages[:100]
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.status == QUEUED:
+            self.status = CANCELLED
+            self.finished_at = time.time()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs on max_workers threads, lowest priority value first
+    At most max_queued jobs may wait; submit() raises queue.Full beyond that
+    """
+    def __init__(self, max_workers=2, max_queued=20, keep_finished=100):
+        self._queue = queue.PriorityQueue(maxsize=max_queued)
+        self._jobs = {}
+        self._finished = []
+        self._keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()  # FIFO among equal priorities
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            for i in range(max(max_workers, 1))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, func, *args, priority=0, **kwargs):
+        """
+        Queue func(status_callback, *args, **kwargs) and return the job
+        The function's return value becomes job.result
+        """
+        job = IngestionJob(func, args, kwargs, priority)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), job))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job and not job.finished:
+            job.cancel()
+            if job.finished:
+                self._retire(job)
+
+    def _retire(self, job):
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self._keep_finished:
+                self._jobs.pop(self._finished.pop(0), None)
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            try:
+                if job.cancelled:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                observe("ingest_queue_wait_seconds", job.started_at - job.created_at)
+                try:
+                    job.result = job._func(job.report, *job._args, **job._kwargs)
+                    job.status = CANCELLED if job.cancelled else DONE
+                except IngestionCancelled:
+                    job.status = CANCELLED
+                except Exception as e:
+                    job.error = str(e)
+                    job.status = FAILED
+                job.finished_at = time.time()
+                increment("ingest_jobs", status=job.status)
+                self._retire(job)
+            finally:
+                self._queue.task_done()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_ingestion_manager():
+    """Process-wide job manager shared by all sessions"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IngestionJobManager(
+                max_workers=settings.INGEST_WORKERS,
+                max_queued=settings.INGEST_MAX_QUEUED
+            )
+        return _manager
+
+def save_upload(name, data):
+    """
+    Keep an uploaded PDF as UPLOAD_DIR/<name>.pdf (name should be content-addressed)
+    Written atomically and only once, since other sessions may upload the same bytes
+    """
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(settings.UPLOAD_DIR, f"{name}.pdf")
+    if not os.path.exists(file_path):
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=settings.UPLOAD_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    return file_path
+
+def ingest_pdf(status_callback, source, metadata=None, cache_key=None):
+    """
+    Standard ingestion job: index cache lookup, then extract -> chunk -> embed -> index
+    source is the PDF's bytes (uploads are never written to disk on this path) or a file path
+    Returns {"vectorstore": ..., "doc_key": cache_key}
+    """
+    with span("ingest.document") as ingest_span:
+        vectorstore = load_cached_vectorstore(cache_key, status_callback) if cache_key else None
+        ingest_span.set(cache_hit=vectorstore is not None)
+        if cache_key:
+            increment("index_cache_requests", result="hit" if vectorstore is not None else "miss")
+        if vectorstore is None:
+            # Extraction, OCR and embedding are interleaved (pages stream into batches)
+            with span("ingest.extract_and_embed"):
+                vectorstore = create_vectorstore_from_pages(
+                    iter_pdf_pages(source, status_callback=status_callback, name=(metadata or {}).get("source")),
+                    metadata=metadata,
+                    status_callback=status_callback
+                )
+            if vectorstore is not None and cache_key:
+                with span("ingest.cache_save"):
+                    save_vectorstore_to_cache(cache_key, vectorstore)
+                # Swap the private in-RAM copy for the shared memory-mapped one
+                vectorstore = load_cached_vectorstore(cache_key) or vectorstore
+        if vectorstore is not None:
+            ingest_span.set(chunks=vectorstore.index.ntotal)
+    if settings.KEEP_UPLOADS and cache_key and isinstance(source, (bytes, bytearray)):
+        # Off the request path, after the document is searchable
+        save_upload(cache_key, source)
+    return {"vectorstore": vectorstore, "doc_key": cache_key}
@@ -0,0 +1,212 @@
+# src/lexical_index.py
+# Array-backed BM25 index built next to the FAISS index, plus hybrid (BM25 + dense) retrieval
+import os
+import re
+import weakref
+from collections import Counter
+import numpy as np
+from src.config import settings
+
+LEXICAL_FILE = "bm25.npz"
+
+# Keeps part numbers, clause ids and versions ("ab-1234", "4.2.1", "v2/rev3") as single tokens
+_TOKEN_RE = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+class BM25Index:
+    """
+    BM25 over a fixed set of documents, stored as CSR postings:
+    postings for term t are docs[offsets[t]:offsets[t+1]] with term frequencies tfs[...]
+    """
+    def __init__(self, vocab, doc_ids, offsets, docs, tfs, doc_lengths, k1=1.5, b=0.75):
+        self.vocab = vocab  # term -> term id
+        self.doc_ids = doc_ids  # position -> docstore id
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(doc_ids)
+        doc_freq = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+        # Per-document part of the BM25 denominator, precomputed once
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / avg_length)).astype(np.float32) if n_docs else doc_lengths
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1=1.5, b=0.75):
+        vocab = {}
+        postings = []  # term id -> [(doc position, tf)]
+        doc_lengths = np.zeros(len(doc_ids), dtype=np.float32)
+
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((position, tf))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term_id, entries in enumerate(postings):
+            start = offsets[term_id]
+            for i, (position, tf) in enumerate(entries):
+                docs[start + i] = position
+                tfs[start + i] = tf
+
+        return cls(vocab, list(doc_ids), offsets, docs, tfs, doc_lengths, k1, b)
+
+    def search(self, query, k=4):
+        """Top-k (docstore id, score) pairs for query"""
+        if not self.doc_ids:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end]
+            # Each doc appears once per term's postings, so fancy-index += is safe
+            scores[docs] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.doc_ids[i], float(scores[i])) for i in candidates]
+
+    def save(self, path):
+        terms = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            path,
+            terms=np.array(terms, dtype=str),
+            doc_ids=np.array(self.doc_ids, dtype=str),
+            offsets=self.offsets,
+            docs=self.docs,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+            params=np.array([self.k1, self.b], dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            k1, b = data["params"].tolist()
+            return cls(
+                vocab, data["doc_ids"].tolist(), data["offsets"], data["docs"],
+                data["tfs"], data["doc_lengths"], k1, b
+            )
+
+# Lexical indexes ride alongside the FAISS store without changing its class
+_lexical_indexes = weakref.WeakKeyDictionary()
+
+def build_lexical_index(vectorstore):
+    """Build (and attach) a BM25 index over every chunk in a FAISS store, in index order"""
+    doc_ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+    texts = (vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids)
+    index = BM25Index.build(doc_ids, texts)
+    _lexical_indexes[vectorstore] = index
+    return index
+
+def get_lexical_index(vectorstore, build=True):
+    index = _lexical_indexes.get(vectorstore)
+    if index is None and build:
+        index = build_lexical_index(vectorstore)
+    return index
+
+def save_lexical_index(vectorstore, directory):
+    index = get_lexical_index(vectorstore, build=False)
+    if index is not None:
+        index.save(os.path.join(directory, LEXICAL_FILE))
+
+def load_lexical_index(vectorstore, directory):
+    """Attach the persisted BM25 index from directory, rebuilding it if missing"""
+    path = os.path.join(directory, LEXICAL_FILE)
+    if os.path.exists(path):
+        _lexical_indexes[vectorstore] = BM25Index.load(path)
+        return _lexical_indexes[vectorstore]
+    return build_lexical_index(vectorstore)
+
+class HybridRetriever:
+    """
+    Dense FAISS search and BM25 fused with reciprocal-rank fusion:
+    score(doc) = sum over rankings of 1 / (rrf_k + rank)
+    sources optionally restricts results to chunks whose metadata source_id is in it
+    """
+    def __init__(self, vectorstore, lexical_index, k=None, fetch_k=None, rrf_k=None, sources=None):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.k = k or settings.RETRIEVAL_K
+        self.fetch_k = fetch_k or settings.HYBRID_FETCH_K
+        self.rrf_k = rrf_k or settings.HYBRID_RRF_K
+        self.sources = set(sources) if sources else None
+
+    def _document(self, doc_id, doc_cache=None):
+        # doc_cache shares fetched chunks between the queries of one batch
+        if doc_cache is None:
+            return self.vectorstore.docstore.search(doc_id)
+        doc = doc_cache.get(doc_id)
+        if doc is None:
+            doc = doc_cache[doc_id] = self.vectorstore.docstore.search(doc_id)
+        return doc
+
+    def _allowed(self, doc_id, doc_cache=None):
+        if self.sources is None:
+            return True
+        return self._document(doc_id, doc_cache).metadata.get("source_id") in self.sources
+
+    def dense_search_by_vectors(self, vectors, doc_cache=None):
+        """Dense rankings (docstore ids) for many query vectors with one index.search call"""
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        # Over-fetch when filtering so enough candidates survive
+        fetch_k = self.fetch_k if self.sources is None else self.fetch_k * 4
+        _, positions = self.vectorstore.index.search(matrix, fetch_k)
+        rankings = []
+        for row in positions:
+            doc_ids = [self.vectorstore.index_to_docstore_id[i] for i in row if i != -1]
+            rankings.append([doc_id for doc_id in doc_ids if self._allowed(doc_id, doc_cache)][:self.fetch_k])
+        return rankings
+
+    def dense_search(self, query):
+        return self.dense_search_by_vectors([self.vectorstore.embedding_function.embed_query(query)])[0]
+
+    def lexical_search(self, query, doc_cache=None):
+        fetch_k = self.fetch_k if self.sources is None else self.fetch_k * 4
+        doc_ids = [doc_id for doc_id, _ in self.lexical_index.search(query, fetch_k)]
+        return [doc_id for doc_id in doc_ids if self._allowed(doc_id, doc_cache)][:self.fetch_k]
+
+    def _fuse(self, *rankings):
+        fused = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        return sorted(fused, key=fused.get, reverse=True)[:self.k]
+
+    def get_relevant_documents(self, query):
+        top_ids = self._fuse(self.dense_search(query), self.lexical_search(query))
+        return [self.vectorstore.docstore.search(doc_id) for doc_id in top_ids]
+
+    def get_relevant_documents_batch(self, queries, vectors, doc_cache=None):
+        """
+        get_relevant_documents for many queries whose embeddings are already known
+        One vectorized dense search; a chunk shared by several queries is fetched once
+        """
+        doc_cache = {} if doc_cache is None else doc_cache
+        results = []
+        for query, dense_ids in zip(queries, self.dense_search_by_vectors(vectors, doc_cache)):
+            top_ids = self._fuse(dense_ids, self.lexical_search(query, doc_cache))
+            results.append([self._document(doc_id, doc_cache) for doc_id in top_ids])
+        return results
+
+    invoke = get_relevant_documents
@@ -0,0 +1,227 @@
+# src/memory_backend.py
+# Conversation memory kept outside the process (MEMORY_BACKEND), so chat history survives
+# restarts and is shared by workers (documents are not): an append-only message log per session with
+# a rolling summary, idle expiry (MEMORY_TTL_SECONDS) and a per-session message cap
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_messages_session ON memory_messages (session_id, seq);
+CREATE TABLE IF NOT EXISTS memory_sessions (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL DEFAULT '',
+    expires_at REAL NOT NULL
+);
+"""
+
+class SQLiteMemoryBackend:
+    """
+    Message log in one SQLite file (WAL mode, so worker processes on a host can share it)
+    Messages are only inserted or deleted from the front; sequence numbers never repeat
+    """
+    PURGE_INTERVAL_SECONDS = 300
+
+    def __init__(self, path, ttl_seconds=86400, max_messages=200):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self._last_purge = 0.0
+        self.purge_expired()
+
+    def _touch(self, session_id, now, summary=None):
+        if summary is None:
+            self._conn.execute(
+                "INSERT INTO memory_sessions (session_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET expires_at = excluded.expires_at",
+                (session_id, now + self.ttl_seconds)
+            )
+        else:
+            self._conn.execute(
+                "INSERT INTO memory_sessions (session_id, summary, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, expires_at = excluded.expires_at",
+                (session_id, summary, now + self.ttl_seconds)
+            )
+
+    def _drop_if_expired(self, session_id, now):
+        row = self._conn.execute(
+            "SELECT expires_at FROM memory_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is not None and row[0] < now:
+            self._conn.execute("DELETE FROM memory_messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM memory_sessions WHERE session_id = ?", (session_id,))
+
+    def append(self, session_id, messages):
+        """Append (role, content, tokens) messages; returns their sequence numbers"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._drop_if_expired(session_id, now)
+            self._touch(session_id, now)
+            seqs = [
+                self._conn.execute(
+                    "INSERT INTO memory_messages (session_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+                    (session_id, role, content, tokens)
+                ).lastrowid
+                for role, content, tokens in messages
+            ]
+            # Per-session cap: oldest messages beyond max_messages go
+            self._conn.execute(
+                "DELETE FROM memory_messages WHERE session_id = ? AND seq <= "
+                "(SELECT seq FROM memory_messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.max_messages)
+            )
+        if now - self._last_purge > self.PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+        return seqs
+
+    def read(self, session_id, after_seq=0):
+        """
+        (first_seq, [(seq, role, content, tokens)] after after_seq, summary)
+        first_seq is the oldest message still stored (None when the session is empty or expired)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, expires_at FROM memory_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None, [], ""
+            first_seq = self._conn.execute(
+                "SELECT MIN(seq) FROM memory_messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, role, content, tokens FROM memory_messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, after_seq)
+            ).fetchall()
+        return first_seq, rows, row[0]
+
+    def trim(self, session_id, first_seq):
+        """Delete the session's messages older than first_seq"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM memory_messages WHERE session_id = ? AND seq < ?", (session_id, first_seq))
+
+    def set_summary(self, session_id, summary):
+        with self._lock, self._conn:
+            self._touch(session_id, time.time(), summary)
+
+    def clear(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM memory_messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM memory_sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self):
+        """Delete every expired session (also runs every few minutes from append)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM memory_messages WHERE session_id IN "
+                "(SELECT session_id FROM memory_sessions WHERE expires_at < ?)", (now,)
+            )
+            self._conn.execute("DELETE FROM memory_sessions WHERE expires_at < ?", (now,))
+        self._last_purge = now
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+class RedisMemoryBackend:
+    """
+    Same interface over a Redis-compatible client: redis.Redis, or any object with
+    incrby, zadd, zrangebyscore, zrange, zremrangebyscore, zremrangebyrank, hget, hset, expire, delete
+    Messages are a sorted set scored by sequence number (from one shared counter,
+    so numbers never repeat); both session keys expire after ttl_seconds idle
+    """
+    def __init__(self, client, ttl_seconds=86400, max_messages=200, prefix="qabot:memory:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        return f"{self.prefix}{session_id}:messages", f"{self.prefix}{session_id}:meta"
+
+    def _touch(self, *keys):
+        for key in keys:
+            self.client.expire(key, self.ttl_seconds)
+
+    def append(self, session_id, messages):
+        messages_key, meta_key = self._keys(session_id)
+        last = int(self.client.incrby(f"{self.prefix}seq", len(messages)))
+        seqs = list(range(last - len(messages) + 1, last + 1))
+        self.client.zadd(messages_key, {
+            json.dumps([seq, role, content, tokens]): seq
+            for seq, (role, content, tokens) in zip(seqs, messages)
+        })
+        self.client.zremrangebyrank(messages_key, 0, -self.max_messages - 1)
+        self.client.hset(meta_key, "updated_at", time.time())
+        self._touch(messages_key, meta_key)
+        return seqs
+
+    def read(self, session_id, after_seq=0):
+        messages_key, meta_key = self._keys(session_id)
+        first = self.client.zrange(messages_key, 0, 0, withscores=True)
+        rows = [tuple(json.loads(member)) for member in self.client.zrangebyscore(messages_key, after_seq + 1, "+inf")]
+        summary = _text(self.client.hget(meta_key, "summary")) or ""
+        return (int(first[0][1]) if first else None), rows, summary
+
+    def trim(self, session_id, first_seq):
+        self.client.zremrangebyscore(self._keys(session_id)[0], "-inf", first_seq - 1)
+
+    def set_summary(self, session_id, summary):
+        messages_key, meta_key = self._keys(session_id)
+        self.client.hset(meta_key, "summary", summary)
+        self._touch(messages_key, meta_key)
+
+    def clear(self, session_id):
+        self.client.delete(*self._keys(session_id))
+
+    def purge_expired(self):
+        pass  # Redis expires keys itself
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_memory_backend(name=None):
+    """Backend for MEMORY_BACKEND (local | sqlite | redis); None means in-process memory"""
+    name = (name or settings.MEMORY_BACKEND).lower()
+    if name == "local":
+        return None
+    if name == "sqlite":
+        return SQLiteMemoryBackend(
+            settings.MEMORY_SQLITE_PATH, settings.MEMORY_TTL_SECONDS, settings.MEMORY_STORE_MAX_MESSAGES
+        )
+    if name == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("MEMORY_BACKEND=redis needs the redis package (pip install redis)")
+        return RedisMemoryBackend(
+            redis.Redis.from_url(settings.MEMORY_REDIS_URL), settings.MEMORY_TTL_SECONDS, settings.MEMORY_STORE_MAX_MESSAGES
+        )
+    raise ValueError(f"Unknown MEMORY_BACKEND: {name} (expected local, sqlite or redis)")
+
+def get_memory_backend():
+    """This process's shared backend (created on first use, so forked workers get their own connection)"""
+    global _backend
+    if settings.MEMORY_BACKEND.lower() == "local":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_memory_backend()
+        return _backend
@@ -1,17 +1,236 @@
 # src/memory_store.py
+import logging
+import threading
+from src.config import settings
+from src.context_packer import count_tokens, format_history_lines, truncate_to_tokens
+from src.memory_backend import get_memory_backend
+
 try:
-    from langchain_community.memory import ConversationBufferWindowMemory
+    from langchain_core.messages import AIMessage, HumanMessage
 except ImportError:
-    from langchain.memory import ConversationBufferWindowMemory
-
-def create_session_memory(max_token_limit=1000):
-    """Create a new memory instance for a session with token limit"""
-    return ConversationBufferWindowMemory(
-        memory_key="chat_history",
-        return_messages=True,
-        k=10,  # Keep last 10 exchanges
-        max_token_limit=max_token_limit
-    )
+    from langchain.schema import AIMessage, HumanMessage
+
+logger = logging.getLogger("qabot.memory")
+
+SUMMARY_TEMPLATE = """Progressively summarize a conversation between a user and a document assistant.
+Keep facts, names, numbers and the user's questions; drop greetings and filler. Reply with the summary only, at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+class ChatHistory:
+    """Ordered messages (HumanMessage / AIMessage) of one session"""
+    def __init__(self):
+        self.messages = []
+
+    def add_user_message(self, content):
+        self.messages.append(HumanMessage(content=content))
+
+    def add_ai_message(self, content):
+        self.messages.append(AIMessage(content=content))
+
+    def clear(self):
+        self.messages = []
+
+_MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage}
+
+class SessionMemory:
+    """
+    Last k exchanges, trimmed oldest-first to max_token_limit tokens on every save
+    Same interface the chain used from ConversationBufferWindowMemory
+    (chat_memory.messages, save_context, clear), which ignored max_token_limit
+    With a backend (see memory_backend) messages are appended there and read back
+    incrementally, so the session survives restarts and any worker can serve it
+    """
+    summary = ""
+
+    def __init__(self, k=10, max_token_limit=1000, backend=None, session_id=None):
+        self.k = k
+        self.max_token_limit = max_token_limit
+        self.chat_memory = ChatHistory()
+        # Parallel to chat_memory.messages: token count, formatted ("human: ...") line
+        # with its token count, and backend sequence number
+        self._tokens = []
+        self._lines = []
+        self._seqs = []
+        self._version = 0
+        self._formatted = None  # (version, max_tokens, summary, text) of the last format_history
+        self.backend = backend
+        self.session_id = session_id
+        if backend is not None:
+            self.refresh()
+
+    def _add(self, message, tokens=None, seq=None):
+        self.chat_memory.messages.append(message)
+        line = f"{message.type}: {message.content}"
+        self._tokens.append(count_tokens(message.content) if tokens is None else tokens)
+        self._lines.append((line, count_tokens(line) + 1))
+        self._seqs.append(seq)
+        self._version += 1
+
+    def _drop_front(self, count):
+        removed = self.chat_memory.messages[:count]
+        for items in (self.chat_memory.messages, self._tokens, self._lines, self._seqs):
+            del items[:count]
+        self._version += 1
+        return removed
+
+    def refresh(self):
+        """
+        Pick up what was written to the backend since the last read (e.g. by another
+        worker): new messages, trims and the summary; returns the stored summary
+        """
+        first_seq, rows, summary = self.backend.read(self.session_id, self._seqs[-1] if self._seqs else 0)
+        if first_seq is None:
+            stale = len(self._seqs)  # expired or cleared
+        else:
+            stale = sum(1 for seq in self._seqs if seq < first_seq)
+        if stale:
+            self._drop_front(stale)
+        for seq, role, content, tokens in rows:
+            self._add(_MESSAGE_TYPES[role](content=content), tokens, seq)
+        return summary
+
+    def save_context(self, inputs, outputs):
+        messages = [HumanMessage(content=inputs["input"]), AIMessage(content=outputs["output"])]
+        if self.backend is None:
+            for msg in messages:
+                self._add(msg)
+        else:
+            # Append-only write, then read back in sequence order (other workers' turns included)
+            self.backend.append(self.session_id, [(msg.type, msg.content, count_tokens(msg.content)) for msg in messages])
+            self.refresh()
+        if len(self._tokens) > 2 * self.k or sum(self._tokens) > self.max_token_limit:
+            self._evicted(self._trim(self._trim_target()))
+
+    def _trim_target(self):
+        return self.max_token_limit
+
+    def _trim(self, max_tokens):
+        """Drop whole exchanges from the front (always keeping the latest) and return them"""
+        messages = self.chat_memory.messages
+        total = sum(self._tokens)
+        cut = 0
+        while len(messages) - cut > 2 and (len(messages) - cut > 2 * self.k or total > max_tokens):
+            total -= self._tokens[cut] + self._tokens[cut + 1]
+            cut += 2
+        removed = self._drop_front(cut) if cut else []
+        if removed and self.backend is not None:
+            self.backend.trim(self.session_id, self._seqs[0])
+        return removed
+
+    def _evicted(self, messages):
+        pass
+
+    def format_history(self, max_tokens):
+        """
+        context_packer.format_history over the cached per-message lines; the text is
+        reused until a message, the summary or max_tokens changes
+        """
+        if self.backend is not None:
+            self.refresh()
+        key = (self._version, max_tokens, self.summary)
+        if self._formatted is None or self._formatted[:3] != key:
+            self._formatted = key + (format_history_lines(self._lines, max_tokens, self.summary),)
+        return self._formatted[3]
+
+    def clear(self):
+        self.chat_memory.clear()
+        self._tokens = []
+        self._lines = []
+        self._seqs = []
+        self._version += 1
+        if self.backend is not None:
+            self.backend.clear(self.session_id)
+
+class SummarizingMemory(SessionMemory):
+    """
+    Rolling-summary memory: exchanges trimmed from the window are queued and
+    folded into a running summary by compact(llm), so older turns survive compressed
+    Trims go down to half the limit, so one summary call covers several exchanges
+    compact() may run on another thread while the session keeps answering
+    """
+    def __init__(self, k=10, max_token_limit=1000, summary_max_tokens=300, backend=None, session_id=None):
+        self.summary_max_tokens = summary_max_tokens
+        self.summary = ""
+        self.pending = []
+        # Guards pending, summary and _generation; held only briefly, never over the LLM call
+        self._compact_lock = threading.Lock()
+        self._summary_call_lock = threading.Lock()  # one summary call at a time
+        self._generation = 0  # bumped by clear(), so a summary of cleared turns is discarded
+        super().__init__(k, max_token_limit, backend, session_id)
+
+    def refresh(self):
+        summary = super().refresh() or ""
+        with self._compact_lock:
+            self.summary = summary
+        return summary
+
+    def _trim_target(self):
+        return self.max_token_limit // 2
+
+    def _evicted(self, messages):
+        with self._compact_lock:
+            self.pending.extend(messages)
+
+    def compact(self, llm):
+        """Fold pending exchanges into the summary with one LLM call"""
+        with self._summary_call_lock:
+            with self._compact_lock:
+                # Exchanges trimmed while the call runs queue up for the next compact
+                pending, self.pending = self.pending, []
+                if not pending:
+                    return
+                generation = self._generation
+                summary = self.summary
+            new_lines = "\n".join(f"{msg.type}: {msg.content}" for msg in pending)
+            prompt = SUMMARY_TEMPLATE.format(
+                max_words=int(self.summary_max_tokens * 0.75),
+                summary=summary or "(none)",
+                new_lines=truncate_to_tokens(new_lines, self.max_token_limit)
+            )
+            summary = llm(prompt)
+            if not summary or summary.startswith("Error:"):
+                # Same outcome as window mode: the trimmed turns are dropped
+                logger.warning("Conversation summary failed; keeping the previous summary")
+                return
+            with self._compact_lock:
+                if generation != self._generation:
+                    return
+                self.summary = truncate_to_tokens(summary.strip(), self.summary_max_tokens)
+                if self.backend is not None:
+                    self.backend.set_summary(self.session_id, self.summary)
+
+    def clear(self):
+        super().clear()
+        with self._compact_lock:
+            self.summary = ""
+            self.pending = []
+            self._generation += 1
+
+def create_session_memory(max_token_limit=None, mode=None, session_id=None):
+    """
+    Create a new memory instance for a session with token limit
+    mode: "window" drops the oldest exchanges past the limit, "summary" summarizes them
+    (defaults: MEMORY_MAX_TOKENS / MEMORY_MODE)
+    With a session_id the memory is kept in MEMORY_BACKEND when one is configured,
+    and an existing conversation for that id is picked up
+    """
+    max_token_limit = max_token_limit or settings.MEMORY_MAX_TOKENS
+    mode = (mode or settings.MEMORY_MODE).lower()
+    backend = get_memory_backend() if session_id else None
+    if mode == "summary":
+        return SummarizingMemory(
+            settings.MEMORY_WINDOW_TURNS, max_token_limit, settings.MEMORY_SUMMARY_MAX_TOKENS, backend, session_id
+        )
+    if mode != "window":
+        raise ValueError(f"Unknown MEMORY_MODE: {mode} (expected window or summary)")
+    return SessionMemory(settings.MEMORY_WINDOW_TURNS, max_token_limit, backend, session_id)
 
 def get_conversation_context(memory, max_exchanges=3):
     """Get formatted conversation context for the LLM"""
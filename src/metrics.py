@@ -0,0 +1,327 @@
+# src/metrics.py
+# Lightweight tracing and metrics: spans, counters and histograms with pluggable exporters
+# (log, Prometheus text file, OpenTelemetry). Everything is a no-op unless METRICS_ENABLED.
+import atexit
+import contextvars
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from functools import wraps
+from src.config import settings
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger("qabot.metrics")
+
+# Seconds; also fine for token counts up to a few thousand via the +Inf bucket
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_exporters = []
+_registry_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets": [...], "sum": float, "count": int}
+_current_span = contextvars.ContextVar("qabot_current_span", default=None)
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def increment(name, value=1, **labels):
+    """Add value to counter name{labels}"""
+    if not _enabled:
+        return
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """Record one observation in histogram name{labels}"""
+    if not _enabled:
+        return
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+def get_metrics_snapshot():
+    """Copy of every counter and histogram: {"counters": {...}, "histograms": {...}}"""
+    with _registry_lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {key: dict(value, buckets=list(value["buckets"])) for key, value in _histograms.items()},
+        }
+
+def reset_metrics():
+    with _registry_lock:
+        _counters.clear()
+        _histograms.clear()
+
+class Span:
+    """
+    One timed stage. Use as a context manager (becomes the parent of spans opened
+    inside it), or start()/finish() when the stage spans generator yields
+    """
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.error = None
+        self.start_time_ns = None
+        self.end_time_ns = None
+        self.duration = None
+        self._start = None
+        self._token = None
+        self.exporter_state = {}  # per-exporter handles, e.g. the OpenTelemetry span
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def start(self):
+        self.parent = _current_span.get()
+        self.start_time_ns = time.time_ns()
+        self._start = time.perf_counter()
+        for exporter in _exporters:
+            exporter.on_start(self)
+        return self
+
+    def finish(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.end_time_ns = time.time_ns()
+        self.error = error
+        observe("span_seconds", self.duration, span=self.name)
+        if error:
+            increment("span_errors", span=self.name)
+        for exporter in _exporters:
+            try:
+                exporter.on_end(self)
+            except Exception as e:
+                logger.warning("Metrics exporter %s failed: %s", type(exporter).__name__, e)
+
+    def __enter__(self):
+        self.start()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.finish(exc_type.__name__ if exc_type else None)
+        return False
+
+class _NoopSpan:
+    """Returned while metrics are disabled; every method does nothing"""
+    name = None
+    attributes = {}
+
+    def set(self, **attributes):
+        pass
+
+    def start(self):
+        return self
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(name, **attributes):
+    """Context manager timing a stage: with span("qa.retrieval") as s: ... s.set(docs=4)"""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+def start_span(name, **attributes):
+    """Started span that is not made current; call .finish() when the stage ends"""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes).start()
+
+def current_span():
+    """Innermost active span (a no-op span when there is none)"""
+    return (_current_span.get() if _enabled else None) or _NOOP_SPAN
+
+def traced(name):
+    """Decorator: run the function inside span(name)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class LogExporter:
+    """Logs every finished span with its duration, parent and attributes"""
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        if not logger.isEnabledFor(self.level):
+            return
+        parent = f" parent={span.parent.name}" if span.parent else ""
+        error = f" error={span.error}" if span.error else ""
+        attributes = "".join(f" {key}={value}" for key, value in span.attributes.items())
+        logger.log(self.level, "span %s %.1fms%s%s%s", span.name, span.duration * 1000, parent, error, attributes)
+
+    def flush(self):
+        pass
+
+def _metric_name(name):
+    return "qabot_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def render_prometheus(snapshot=None):
+    """Prometheus text exposition format for the current registry"""
+    snapshot = snapshot or get_metrics_snapshot()
+    lines = []
+    for name in sorted({name for name, _ in snapshot["counters"]}):
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_name, labels), value in sorted(snapshot["counters"].items()):
+            if counter_name == name:
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in snapshot["histograms"]}):
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} histogram")
+        for (histogram_name, labels), histogram in sorted(snapshot["histograms"].items()):
+            if histogram_name != name:
+                continue
+            for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+class PrometheusTextfileExporter:
+    """
+    Rewrites a Prometheus text file (node_exporter textfile collector format)
+    at most every interval seconds; the write is atomic
+    """
+    def __init__(self, path, interval=15.0):
+        self.path = path
+        self.interval = interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        if time.monotonic() - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_write = time.monotonic()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(render_prometheus())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+class OpenTelemetryExporter:
+    """Mirrors spans (with parent links and attributes) into the OpenTelemetry tracer provider"""
+    def __init__(self, tracer_name="qabot"):
+        self.tracer = otel_trace.get_tracer(tracer_name)
+
+    def on_start(self, span):
+        parent = span.parent.exporter_state.get("otel") if span.parent else None
+        context = otel_trace.set_span_in_context(parent) if parent is not None else None
+        span.exporter_state["otel"] = self.tracer.start_span(
+            span.name, context=context, start_time=span.start_time_ns,
+            attributes={key: value for key, value in span.attributes.items() if isinstance(value, (str, bool, int, float))}
+        )
+
+    def on_end(self, span):
+        otel_span = span.exporter_state.get("otel")
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error:
+            otel_span.set_attribute("error.type", span.error)
+        otel_span.end(end_time=span.end_time_ns)
+
+    def flush(self):
+        pass
+
+def _build_exporters(names):
+    exporters = []
+    for name in (name.strip().lower() for name in names.split(",")):
+        if not name:
+            continue
+        if name == "log":
+            exporters.append(LogExporter())
+        elif name == "prometheus":
+            exporters.append(PrometheusTextfileExporter(
+                settings.METRICS_PROMETHEUS_FILE, settings.METRICS_PROMETHEUS_INTERVAL
+            ))
+        elif name in ("otel", "opentelemetry"):
+            if otel_trace is None:
+                logger.warning("METRICS_EXPORTERS includes %s but opentelemetry-api is not installed", name)
+                continue
+            exporters.append(OpenTelemetryExporter())
+        else:
+            logger.warning("Unknown metrics exporter: %s", name)
+    return exporters
+
+def configure(enabled=None, exporters=None):
+    """
+    (Re)configure instrumentation; defaults come from METRICS_ENABLED / METRICS_EXPORTERS
+    exporters may be a comma-separated string or a list of exporter objects
+    """
+    global _enabled, _exporters
+    if enabled is None:
+        enabled = settings.METRICS_ENABLED
+    if exporters is None:
+        exporters = settings.METRICS_EXPORTERS
+    _exporters = _build_exporters(exporters) if isinstance(exporters, str) else list(exporters)
+    _enabled = bool(enabled)
+
+def flush():
+    """Push buffered metrics out now (e.g. before exit)"""
+    for exporter in _exporters:
+        try:
+            exporter.flush()
+        except Exception as e:
+            logger.warning("Metrics exporter %s failed: %s", type(exporter).__name__, e)
+
+configure()
+atexit.register(flush)
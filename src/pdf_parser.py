@@ -1,96 +1,207 @@
-import fitz  # pip install pymupdf
-from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
-from PIL import Image
+from collections import deque
+from src.ocr_engine import get_ocr_engine, get_ocr_pool
+from src.metrics import increment, observe
+from src.config import settings
 import os
-import tempfile
+import time
 import numpy as np
 
-def extract_text_with_ocr(pdf_path, status_callback=None):
-    """Extract text from PDF using PaddleOCR as fallback"""
-    try:
-        if status_callback:
-            status_callback(" Initializing PaddleOCR (this may take a moment on first run)...")
+# PyMuPDF is imported on first use so importing this module stays cheap
+
+def open_pdf(source):
+    """
+    Open a PDF from a file path or from its bytes
+    Bytes are parsed in memory: nothing is written to disk
+    """
+    import fitz  # pip install pymupdf
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(source) if isinstance(source, memoryview) else source, filetype="pdf")
+    return fitz.open(source)
+
+def render_page(page, dpi):
+    """Rasterize a PyMuPDF page to an RGB uint8 array (height, width, 3) for OCR"""
+    import fitz  # pip install pymupdf
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    return np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, 3)
+
+def _parse_ocr_results(results):
+    """Split PaddleOCR output into (confident texts, detections, low confidence count)"""
+    page_text = []
+    page_detections = 0
+    page_low_confidence = 0
+    
+    if results and results[0]:  # Check if results exist
+        for line in results[0]:
+            if line and len(line) >= 2:  # Each line should have bbox and text info
+                text_info = line[1]
+                if text_info and len(text_info) >= 2:
+                    text = text_info[0]
+                    confidence = text_info[1]
+                    page_detections += 1
+                    
+                    # Only include text with reasonable confidence (>0.5)
+                    if confidence > 0.5 and text.strip():
+                        page_text.append(text)
+                    else:
+                        page_low_confidence += 1
+    
+    return page_text, page_detections, page_low_confidence
+
+def _ocr_page(image_array, page_number, lang=None):
+    """
+    OCR one rendered page (see render_page) with this process's engine
+    Returns (page_number, texts, detections, low_confidence, stage_timings)
+    """
+    timings = {}
+    
+    start = time.perf_counter()
+    engine = get_ocr_engine(lang)
+    timings["init"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    results = engine.ocr(image_array)
+    timings["recognize"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    page_text, page_detections, page_low_confidence = _parse_ocr_results(results)
+    timings["parse"] = time.perf_counter() - start
+    
+    return page_number, page_text, page_detections, page_low_confidence, timings
+
+def _record_ocr_page(result):
+    """Per-page OCR metrics; rasterize is timed here, the other stages in the worker that did the page"""
+    _, page_text, page_detections, page_low_confidence, timings = result
+    for stage, seconds in timings.items():
+        observe("ocr_page_stage_seconds", seconds, stage=stage)
+    observe("ocr_page_seconds", sum(timings.values()))
+    increment("ocr_pages", result="text" if page_text else "empty")
+    increment("ocr_detections", page_detections)
+    increment("ocr_low_confidence_detections", page_low_confidence)
+    return result
+
+def iter_ocr_pages(source, page_numbers=None, batch_size=None, dpi=None, lang=None):
+    """
+    Stream OCR results page by page, in page order
+    source is a PDF path or the PDF's bytes. Pages are rendered here with PyMuPDF
+    and handed to the OCR workers as arrays (no temporary image files)
+    Yields (page_number, page_text_segments, detections, low_confidence_count, stage_timings)
+    At most OCR_WORKERS * batch_size rendered pages are held at any time
+    """
+    batch_size = batch_size or settings.OCR_BATCH_SIZE
+    dpi = dpi or settings.OCR_DPI
+    
+    with open_pdf(source) as doc:
+        if page_numbers is None:
+            page_numbers = list(range(1, doc.page_count + 1))
         
-        # Initialize PaddleOCR
-        # use_angle_cls=True to enable text direction classification
-        # lang='en' for English
-        ocr = PaddleOCR(use_angle_cls=True, lang='en')
+        def render(page_number):
+            start = time.perf_counter()
+            image = render_page(doc[page_number - 1], dpi)
+            return image, time.perf_counter() - start
         
-        # Convert PDF pages to images
-        if status_callback:
-            status_callback("Converting PDF pages to images...")
-        images = convert_from_path(pdf_path)
+        def with_render_time(result, seconds):
+            result[4]["rasterize"] = seconds
+            return _record_ocr_page(result)
         
-        if status_callback:
-            status_callback(f" Converted {len(images)} pages to images")
+        if settings.OCR_WORKERS <= 1:
+            for page_number in page_numbers:
+                image, seconds = render(page_number)
+                yield with_render_time(_ocr_page(image, page_number, lang), seconds)
+            return
         
-        extracted_texts = []
-        total_detections = 0
-        low_confidence_count = 0
-        pages_with_text = 0
+        # Shared pool: workers keep their warm engines across documents
+        pool = get_ocr_pool()
+        max_in_flight = max(settings.OCR_WORKERS * batch_size, 1)
+        pages = iter(page_numbers)
+        pending = deque()  # (future, render seconds)
         
-        for i, image in enumerate(images):
-            if status_callback:
-                status_callback(f" Processing page {i+1}/{len(images)} with OCR...")
-            
-            # Convert PIL image to numpy array for PaddleOCR
-            image_array = np.array(image)
-            
-            # Use PaddleOCR to extract text
-            results = ocr.ocr(image_array)
-            
-            # Extract text from results
-            page_text = []
-            page_detections = 0
-            page_low_confidence = 0
-            
-            if results and results[0]:  # Check if results exist
-                for line in results[0]:
-                    if line and len(line) >= 2:  # Each line should have bbox and text info
-                        text_info = line[1]
-                        if text_info and len(text_info) >= 2:
-                            text = text_info[0]
-                            confidence = text_info[1]
-                            page_detections += 1
-                            total_detections += 1
-                            
-                            # Only include text with reasonable confidence (>0.5)
-                            if confidence > 0.5 and text.strip():
-                                page_text.append(text)
-                            else:
-                                page_low_confidence += 1
-                                low_confidence_count += 1
-            
-            if page_text:
-                extracted_texts.append(' '.join(page_text))
-                pages_with_text += 1
-                if status_callback:
-                    status_callback(f"  Page {i+1}: Found {len(page_text)} text segments")
-            else:
-                if page_detections > 0:
-                    if status_callback:
-                        status_callback(f"  Page {i+1}: Found {page_detections} detections but all had low confidence")
-                else:
-                    if status_callback:
-                        status_callback(f"   Page {i+1}: No text detected")
+        def submit(page_number):
+            image, seconds = render(page_number)
+            pending.append((pool.submit(_ocr_page, image, page_number, lang), seconds))
         
-        # Join all text
-        full_text = "\n".join(extracted_texts)
+        try:
+            for page_number in pages:
+                submit(page_number)
+                if len(pending) >= max_in_flight:
+                    break
+            
+            while pending:
+                future, seconds = pending.popleft()
+                result = future.result()
+                next_page = next(pages, None)
+                if next_page is not None:
+                    submit(next_page)
+                yield with_render_time(result, seconds)
+        finally:
+            # Consumer stopped early (or failed) - drop pages not started yet
+            for future, _ in pending:
+                future.cancel()
+
+def ocr_pages(source, page_numbers=None, status_callback=None):
+    """
+    OCR the given 1-based pages (default: all) of a PDF path or bytes and return {page_number: text}
+    Pages with no confident text are left out
+    """
+    if page_numbers is None:
+        with open_pdf(source) as doc:
+            page_numbers = list(range(1, doc.page_count + 1))
+    total_pages = len(page_numbers)
+    
+    if status_callback:
+        status_callback(f" Starting OCR on {total_pages} pages with {settings.OCR_WORKERS} worker(s) (first run may take a moment)...")
+    
+    page_texts = {}
+    total_detections = 0
+    low_confidence_count = 0
+    stage_totals = {}
+    
+    for done, (page_number, page_text, page_detections, page_low_confidence, timings) in enumerate(
+        iter_ocr_pages(source, page_numbers), start=1
+    ):
+        total_detections += page_detections
+        low_confidence_count += page_low_confidence
+        for stage, seconds in timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
         
-        # Provide detailed feedback
         if status_callback:
-            status_callback(f"OCR Results: {pages_with_text}/{len(images)} pages had readable text")
-            if total_detections > 0:
-                status_callback(f" Found {total_detections} total detections ({low_confidence_count} low confidence)")
+            status_callback(f" Processed page {page_number} ({done}/{total_pages}) with OCR")
+        
+        if page_text:
+            page_texts[page_number] = ' '.join(page_text)
+            if status_callback:
+                status_callback(f"  Page {page_number}: Found {len(page_text)} text segments")
+        else:
+            if page_detections > 0:
+                if status_callback:
+                    status_callback(f"  Page {page_number}: Found {page_detections} detections but all had low confidence")
+            else:
+                if status_callback:
+                    status_callback(f"   Page {page_number}: No text detected")
+    
+    # Provide detailed feedback
+    if status_callback:
+        status_callback(f"OCR Results: {len(page_texts)}/{total_pages} pages had readable text")
+        if total_detections > 0:
+            status_callback(f" Found {total_detections} total detections ({low_confidence_count} low confidence)")
+        if stage_totals:
+            timing_summary = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_totals.items())
+            status_callback(f" OCR stage timings (summed over workers): {timing_summary}")
+        if not page_texts:
+            if total_detections == 0:
+                status_callback(" No text detected in any OCR'd page - they may contain only images")
+            else:
+                status_callback(f" All {total_detections} detections had low confidence - text may be unclear")
+    
+    return page_texts
+
+def extract_text_with_ocr(source, status_callback=None, page_numbers=None):
+    """Extract text from a PDF path or bytes using PaddleOCR (streams pages through a worker pool)"""
+    try:
+        page_texts = ocr_pages(source, page_numbers, status_callback)
+        full_text = "\n".join(page_texts[n] for n in sorted(page_texts))
         
         # Check if we extracted any meaningful text
         if not full_text.strip():
-            if status_callback:
-                if total_detections == 0:
-                    status_callback(" No text detected in any page - document may contain only images")
-                else:
-                    status_callback(f" All {total_detections} detections had low confidence - text may be unclear")
             return None
             
         if status_callback:
@@ -102,55 +213,136 @@ def extract_text_with_ocr(pdf_path, status_callback=None):
             status_callback(f" OCR extraction failed: {str(e)}")
         return None
 
-def extract_text_from_pdf(path, status_callback=None):
-    """Extract text from PDF file with OCR fallback and error handling"""
+def _image_coverage(page):
+    """Fraction of the page area covered by raster images (0.0 - 1.0)"""
+    import fitz  # pip install pymupdf
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return 0.0
     
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect  # clip to the visible page
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(covered / page_area, 1.0)
+
+def page_needs_ocr(text, image_coverage):
+    """
+    Decide whether a page must be OCR'd
+    Pages with a usable text layer are kept as-is; pages with (almost) no text
+    but meaningful image coverage are treated as scanned
+    """
+    if len(text.strip()) >= settings.OCR_MIN_TEXT_CHARS:
+        return False
+    return image_coverage >= settings.OCR_MIN_IMAGE_COVERAGE
+
+def iter_pdf_pages(source, status_callback=None, name=None):
+    """
+    Yield (page_number, text) for every page with readable text, in page order
+    source is a PDF path or the PDF's bytes (e.g. an upload, parsed without touching disk).
+    Pages with a text layer use PyMuPDF; only image-only (scanned) pages go to OCR.
+    Text is produced one page at a time and never concatenated.
+    """
     if status_callback:
-        status_callback(f" Processing PDF: {os.path.basename(path)}")
+        if name is None and isinstance(source, (str, os.PathLike)):
+            name = os.path.basename(source)
+        status_callback(f" Processing PDF: {name or 'upload'}")
     
-    # First attempt: Standard text extraction
+    pages_for_ocr = None  # None = text layer unavailable, OCR everything
+    
+    # First pass: classify pages (text is not kept, only the decision)
     try:
         if status_callback:
-            status_callback(" Step 1: Trying standard text extraction...")
-            
-        doc = fitz.open(path)
-        texts = []
+            status_callback(" Step 1: Reading text layer and classifying pages...")
         
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text()
-            if page_text.strip():  # Only add non-empty pages
-                texts.append(page_text)
-        
-        doc.close()
-        
-        # Join all text and clean it up
-        full_text = "\n".join(texts)
+        with open_pdf(source) as doc:
+            total_pages = doc.page_count
+            scanned = [
+                page_num for page_num, page in enumerate(doc, start=1)
+                if page_needs_ocr(page.get_text(), _image_coverage(page))
+            ]
+        # Only once every page was read; otherwise everything goes to OCR
+        pages_for_ocr = scanned
         
         if status_callback:
-            status_callback(f" Standard method found {len(texts)} pages with text, {len(full_text)} total characters")
-        
-        # Check if we extracted meaningful text (more than just whitespace/minimal content)
-        if full_text.strip() and len(full_text.strip()) > 10:
-            if status_callback:
-                status_callback(f" Standard extraction successful! Using extracted text.")
-            return full_text
-        else:
-            if status_callback:
-                status_callback(f" Standard method yielded minimal text, proceeding to OCR...")
+            status_callback(
+                f" {total_pages - len(pages_for_ocr)}/{total_pages} pages have a text layer, "
+                f"{len(pages_for_ocr)} scanned pages need OCR"
+            )
             
     except Exception as e:
         if status_callback:
-            status_callback(f" Standard method failed ({str(e)}), proceeding to OCR...")
+            status_callback(f" Standard method failed ({str(e)}), proceeding to OCR on all pages...")
     
-    # Second attempt: OCR fallback
-    if status_callback:
-        status_callback("🔍 Step 2: Trying OCR to extract text from images...")
-        
-    ocr_text = extract_text_with_ocr(path, status_callback)
-    if ocr_text and len(ocr_text.strip()) > 10:
+    if pages_for_ocr is None:
         if status_callback:
-            status_callback(" OCR extraction successful! Using OCR text.")
-        return ocr_text
+            status_callback("🔍 Step 2: Running OCR on all pages...")
+        try:
+            for page_number, text in iter_ocr_page_texts(source, None, status_callback):
+                yield page_number, text
+        except Exception as e:
+            if status_callback:
+                status_callback(f" OCR extraction failed: {str(e)}")
+        return
+    
+    # Second pass: text-layer pages interleaved with OCR results, in page order
+    if pages_for_ocr and status_callback:
+        status_callback("🔍 Step 2: Running OCR on scanned pages...")
+    ocr_results = iter_ocr_page_texts(source, pages_for_ocr, status_callback) if pages_for_ocr else iter(())
+    ocr_needed = set(pages_for_ocr)
+    next_ocr = None
+    ocr_failed = False
+    
+    try:
+        with open_pdf(source) as doc:
+            for page_num, page in enumerate(doc, start=1):
+                if page_num not in ocr_needed:
+                    page_text = page.get_text()
+                    if page_text.strip():  # Only yield non-empty pages
+                        yield page_num, page_text
+                    continue
+                
+                if ocr_failed:
+                    continue
+                try:
+                    # OCR results arrive in page order; skip pages OCR found nothing on
+                    while next_ocr is None or next_ocr[0] < page_num:
+                        next_ocr = next(ocr_results)
+                except StopIteration:
+                    next_ocr = (float("inf"), "")
+                except Exception as e:
+                    ocr_failed = True
+                    if status_callback:
+                        status_callback(f" OCR extraction failed: {str(e)}")
+                    continue
+                if next_ocr[0] == page_num:
+                    yield next_ocr
+    except Exception as e:
+        # e.g. the file changed or vanished between passes; report it like the first pass
+        if status_callback:
+            status_callback(f" Text extraction failed: {str(e)}")
+
+def iter_ocr_page_texts(source, page_numbers=None, status_callback=None):
+    """Like iter_ocr_pages, but yields (page_number, text) for pages with confident text"""
+    total_pages = None if page_numbers is None else len(page_numbers)
+    for done, (page_number, page_text, page_detections, _, _) in enumerate(
+        iter_ocr_pages(source, page_numbers), start=1
+    ):
+        if status_callback:
+            status_callback(f" Processed page {page_number} ({done}/{total_pages or '?'}) with OCR")
+        if page_text:
+            yield page_number, ' '.join(page_text)
+
+def extract_text_from_pdf(source, status_callback=None):
+    """Extract text from a PDF file path or bytes with per-page OCR for scanned pages"""
+    texts = [text for _, text in iter_pdf_pages(source, status_callback)]
+    full_text = "\n".join(texts)
+    
+    if full_text.strip() and len(full_text.strip()) > 10:
+        if status_callback:
+            status_callback(f" Extraction successful! {len(full_text)} characters from {len(texts)} pages.")
+        return full_text
     
     # Both methods failed
     if status_callback:
@@ -1,53 +1,166 @@
-from langchain.prompts import PromptTemplate
+from src.answer_cache import get_answer_cache
+from src.context_packer import count_tokens, dedupe_chunks, format_history, pack_chunks
+from src.guardrail import get_guardrail_engine
+from src.lexical_index import HybridRetriever, get_lexical_index
+from src.metrics import span, start_span, current_span, increment, observe
+from src.reranker import get_reranker
+from src.vector_store import similarity_search_batch
 from src.config import settings
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import random
+import threading
+import time
 
-def build_qa_chain(vectorstore, memory=None):
-    """Build QA chain with document-focused prompting and conversation memory"""
-    
-    # Use OpenAI as fallback if Groq fails
+# One keep-alive HTTP connection pool per API key, shared by every session
+_groq_clients = {}
+_groq_lock = threading.Lock()
+
+def _load_groq():
+    """The Groq client class, or None if the SDK is not installed (imported on first use)"""
     try:
-        # Try to use Groq first
         from groq import Groq
-        
-        class GroqLLM:
-            def __init__(self, api_key, model_name, temperature=0.1, max_tokens=500):
-                self.client = Groq(api_key=api_key)
-                self.model_name = model_name
-                self.temperature = temperature
-                self.max_tokens = max_tokens
-            
-            def __call__(self, prompt):
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=self.temperature,
-                        max_tokens=self.max_tokens
-                    )
-                    return response.choices[0].message.content
-                except Exception as e:
-                    return f"Error: {str(e)}"
-        
-        # Use custom Groq implementation
-        llm = GroqLLM(
-            api_key=settings.GROQ_API_KEY,
-            model_name=settings.MODEL_NAME,
-            temperature=0.1,
-            max_tokens=500
-        )
-        
-        # Build conversational chain with memory
-        return build_conversational_qa_chain(vectorstore, llm, memory)
-        
     except ImportError:
-        # Fallback to OpenAI
-        return "Currently I am not able to Response"
+        return None
+    return Groq
 
-def build_conversational_qa_chain(vectorstore, llm, memory=None):
-    """Build a conversational QA chain with memory and context handling"""
+def get_groq_client(api_key=None):
+    """Return the process-wide Groq client (reuses connections and TLS sessions)"""
+    api_key = api_key or settings.GROQ_API_KEY
+    client = _groq_clients.get(api_key)
+    if client is not None:
+        return client
+    
+    with _groq_lock:
+        client = _groq_clients.get(api_key)
+        if client is None:
+            import httpx
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings.GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GROQ_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.GROQ_KEEPALIVE_SECONDS
+                ),
+                timeout=settings.GROQ_TIMEOUT_SECONDS
+            )
+            client = _load_groq()(api_key=api_key, http_client=http_client)
+            _groq_clients[api_key] = client
+        return client
+
+def _record_usage(usage):
+    """Token counts reported by Groq (usage may be None, e.g. mid-stream)"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    increment("llm_tokens", prompt_tokens, kind="prompt")
+    increment("llm_tokens", completion_tokens, kind="completion")
+    current_span().set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+class GroqLLM:
+    def __init__(self, api_key, model_name, temperature=0.1, max_tokens=500):
+        self.client = get_groq_client(api_key)
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+    
+    def complete(self, prompt):
+        """One completion; raises the SDK's exception on failure (see complete_with_retry)"""
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        _record_usage(getattr(response, "usage", None))
+        return response.choices[0].message.content
+    
+    def __call__(self, prompt):
+        try:
+            return self.complete(prompt)
+        except Exception as e:
+            increment("llm_errors")
+            return f"Error: {str(e)}"
+    
+    def stream(self, prompt):
+        """
+        Yield the completion as it is generated (stream=True)
+        Raises the SDK's exception on failure, also partway through (see StreamingAnswer)
+        """
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # Groq reports usage on the final chunk
+            _record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+
+# 408 timeout, 409 lock conflict, 429 rate limit; anything >= 500 is retried too
+_RETRY_STATUS = {408, 409, 429}
+
+def _retry_delay(error, attempt):
+    """Seconds to wait before retry number attempt (1-based), or None if error is not transient"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        if status not in _RETRY_STATUS and status < 500:
+            return None
+    elif not isinstance(error, (TimeoutError, ConnectionError)):
+        # SDK errors without a status: APIConnectionError / APITimeoutError
+        name = type(error).__name__
+        if "Connection" not in name and "Timeout" not in name:
+            return None
     
-    # Template for handling greetings, conversation questions, and document questions
-    template = """You are a helpful document analysis assistant. You can handle greetings, conversation history questions, and answer questions about the uploaded document.
+    # Full backoff is capped; jitter spreads retries from concurrent calls apart
+    delay = min(settings.LLM_RETRY_MAX_SECONDS, settings.LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    delay *= random.uniform(0.5, 1.0)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        delay = max(delay, min(float(headers.get("retry-after")), settings.LLM_RETRY_MAX_SECONDS))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+def complete_with_retry(llm, prompt, max_retries=None):
+    """
+    Call llm on prompt, retrying transient failures (rate limits, timeouts, 5xx)
+    Returns the answer, or "Error: ..." like GroqLLM.__call__ once retries are exhausted
+    LLMs without complete() (e.g. test doubles) are called once
+    """
+    complete = getattr(llm, "complete", None)
+    if complete is None:
+        return llm(prompt)
+    max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return complete(prompt)
+        except Exception as e:
+            attempt += 1
+            delay = _retry_delay(e, attempt) if attempt <= max_retries else None
+            if delay is None:
+                increment("llm_errors")
+                return f"Error: {str(e)}"
+            increment("llm_retries", error=type(e).__name__)
+            time.sleep(delay)
+
+# Rolling-summary memory compaction runs here, off the answer path
+_summary_executor = None
+_summary_executor_lock = threading.Lock()
+
+def _get_summary_executor():
+    global _summary_executor
+    with _summary_executor_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="qabot-summary")
+        return _summary_executor
+
+# Template for handling greetings, conversation questions, and document questions
+QA_TEMPLATE = """You are a helpful document analysis assistant. You can handle greetings, conversation history questions, and answer questions about the uploaded document.
 
 INSTRUCTIONS:
 1. For greetings (hi, hello, hey, etc.): Respond warmly and mention you can help with the document
@@ -68,105 +181,452 @@ Current question: {question}
 
 Response:"""
 
-    prompt = PromptTemplate(
-        template=template,
-        input_variables=["context", "question", "chat_history"]
-    )
+_qa_prompt = None
+
+def get_qa_prompt():
+    """QA_TEMPLATE as a PromptTemplate; langchain.prompts is slow to import, so built on first use"""
+    global _qa_prompt
+    if _qa_prompt is None:
+        from langchain.prompts import PromptTemplate
+        _qa_prompt = PromptTemplate(
+            template=QA_TEMPLATE,
+            input_variables=["context", "question", "chat_history"]
+        )
+    return _qa_prompt
+
+def __getattr__(name):
+    # Keeps `from src.qa_chain import QA_PROMPT` working without the eager import
+    if name == "QA_PROMPT":
+        return get_qa_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ConversationalQAChain:
+    def __init__(self, llm, retriever, prompt, memory=None, answer_cache=None, doc_key=None, embeddings=None, reranker=None):
+        self.llm = llm
+        self.retriever = retriever
+        self.prompt = prompt
+        self.memory = memory
+        # Semantic answer cache is used only when we know which document this is
+        self.answer_cache = answer_cache if doc_key and embeddings else None
+        self.doc_key = doc_key
+        self.embeddings = embeddings
+        # Reorders a wider candidate set; without it the retriever's top RETRIEVAL_K are used
+        self.reranker = reranker
+        self._template_tokens = None
+        self.summary_future = None  # latest background memory summarization
     
-    class ConversationalQAChain:
-        def __init__(self, llm, retriever, prompt, memory=None):
-            self.llm = llm
-            self.retriever = retriever
-            self.prompt = prompt
-            self.memory = memory
+    def _prompt_overhead(self, question):
+        """Tokens of the prompt template plus the question, before history and context"""
+        if self._template_tokens is None:
+            self._template_tokens = count_tokens(self.prompt.format(context="", question="", chat_history=""))
+        return self._template_tokens + count_tokens(question)
+    
+    def _history(self, max_tokens):
+        """Newest conversation turns (and the rolling summary) that fit in max_tokens"""
+        if not self.memory:
+            return ""
+        with span("qa.history") as history_span:
+            try:
+                if hasattr(self.memory, "format_history"):
+                    # Formatted lines are cached per message (and the text while nothing changed)
+                    chat_history = self.memory.format_history(max_tokens)
+                else:
+                    chat_history = format_history(
+                        self.memory.chat_memory.messages, max_tokens, getattr(self.memory, "summary", "")
+                    )
+            except:
+                chat_history = ""
+            history_span.set(max_tokens=max_tokens)
+        return chat_history
+    
+    def _prepare(self, question, question_type=None, query_vector=None, docs=None):
+        """
+        Classify the question, retrieve context and build the prompt
+        Returns {"question_type", "prompt", "docs", "answer"}; answer is set
+        only when no LLM call is needed
+        batch() passes in the work it has already done for many questions at once:
+        the type, the question embedding and the retrieved docs
+        """
+        if question_type is None:
+            with span("qa.classify"):
+                # Precompiled rules (see guardrail.GuardrailEngine)
+                question_type = get_guardrail_engine().classify_question(question)
         
-        def __call__(self, inputs):
-            question = inputs.get("question", "")
-            question_lower = question.lower().strip()
-            
-            # Determine question type
-            greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
-            is_greeting = question_lower in greetings
+        # Everything is packed into PROMPT_TOKEN_BUDGET (counted with the configured tokenizer)
+        available = settings.PROMPT_TOKEN_BUDGET - self._prompt_overhead(question)
+        cache_vector = None
+        
+        if question_type == "greeting":
+            formatted_prompt = self.prompt.format(
+                context="No document context needed for greeting",
+                question=question,
+                chat_history=self._history(min(available, settings.HISTORY_TOKEN_BUDGET))
+            )
+            docs = []
+        elif question_type == "conversation":
+            # History is the context here, so it may use the whole budget
+            formatted_prompt = self.prompt.format(
+                context="Use conversation history to answer this question about our chat",
+                question=question,
+                chat_history=self._history(available - 20)
+            )
+            docs = []
+        else:
+            # Near-identical question already answered for this document?
+            if self.answer_cache is not None:
+                with span("qa.answer_cache_lookup") as cache_span:
+                    cache_vector = query_vector if query_vector is not None else self.embeddings.embed_query(question)
+                    cached = self.answer_cache.lookup(self.doc_key, cache_vector)
+                    cache_span.set(hit=bool(cached))
+                increment("answer_cache_requests", result="hit" if cached else "miss")
+                if cached:
+                    return {
+                        "question_type": question_type,
+                        "prompt": None,
+                        "docs": cached["source_documents"],
+                        "answer": cached["answer"],
+                        "cached": True
+                    }
             
-            conversation_patterns = [
-                r"what was my (last|previous|second last|first) question",
-                r"what did i ask (before|earlier|previously)",
-                r"can you repeat",
-                r"what did you (say|tell me) (about|before)",
-                r"go back to",
-                r"earlier you (said|mentioned)",
-                r"in our conversation",
-                r"you mentioned",
-                r"we were talking about",
-                r"from our chat"
-            ]
+            # For document questions, retrieve relevant documents
+            if docs is None:
+                with span("qa.retrieval") as retrieval_span:
+                    if cache_vector is not None:
+                        # Already embedded for the cache lookup; search with that vector
+                        docs = self._retrieve_batch([question], [cache_vector])[0]
+                    else:
+                        docs = self.retriever.get_relevant_documents(question)
+                    retrieval_span.set(docs=len(docs))
+            docs = self._rerank(question, docs) if self.reranker is not None else docs[:settings.RETRIEVAL_K]
             
-            import re
-            is_conversation_question = any(re.search(pattern, question_lower) for pattern in conversation_patterns)
+            if not docs:
+                return {
+                    "question_type": question_type,
+                    "prompt": None,
+                    "docs": [],
+                    "answer": "I cannot find this information in the uploaded document."
+                }
             
-            # Get chat history from memory
-            chat_history = ""
-            if self.memory:
-                try:
-                    history = self.memory.chat_memory.messages
-                    chat_history = "\n".join([f"{msg.type}: {msg.content}" for msg in history[-10:]])
-                except:
-                    chat_history = ""
+            chat_history = self._history(min(available, settings.HISTORY_TOKEN_BUDGET))
             
-            if is_greeting:
-                question_type = "greeting"
-                formatted_prompt = self.prompt.format(
-                    context="No document context needed for greeting",
-                    question=question,
-                    chat_history=chat_history
-                )
-                docs = []
-            elif is_conversation_question:
-                question_type = "conversation"
-                formatted_prompt = self.prompt.format(
-                    context="Use conversation history to answer this question about our chat",
-                    question=question,
-                    chat_history=chat_history
-                )
-                docs = []
-            else:
-                question_type = "document"
-                # For document questions, retrieve relevant documents
-                docs = self.retriever.get_relevant_documents(question)
-                
-                if not docs:
-                    answer = "I cannot find this information in the uploaded document."
-                    if self.memory:
-                        self.memory.save_context({"input": question}, {"output": answer})
-                    return {
-                        "answer": answer,
-                        "source_documents": [],
-                        "question_type": question_type
-                    }
-                
-                # Combine context
-                context = "\n\n".join([doc.page_content for doc in docs[:4]])
+            # Combine context: overlapping chunks merged, then as many as fit the budget
+            with span("qa.prompt_build") as prompt_span:
+                retrieved = len(docs)
+                docs = dedupe_chunks(docs)
+                docs, context_tokens = pack_chunks(docs, available - count_tokens(chat_history))
+                context = "\n\n".join([doc.page_content for doc in docs])
                 formatted_prompt = self.prompt.format(
                     context=context,
                     question=question,
                     chat_history=chat_history
                 )
+                prompt_span.set(prompt_chars=len(formatted_prompt), context_tokens=context_tokens,
+                                retrieved_chunks=retrieved, packed_chunks=len(docs))
+            observe("prompt_context_tokens", context_tokens)
+        
+        return {
+            "question_type": question_type,
+            "prompt": formatted_prompt,
+            "docs": docs,
+            "answer": None,
+            "cache_vector": cache_vector
+        }
+    
+    def _rerank(self, question, docs):
+        """Cross-encoder order of the candidates; falls back to retrieval order if scoring fails"""
+        retrieved = docs[:settings.RETRIEVAL_K]
+        with span("qa.rerank", candidates=len(docs)) as rerank_span:
+            try:
+                docs, stats = self.reranker.rerank(question, docs, settings.RETRIEVAL_K)
+            except Exception as e:
+                increment("rerank_errors", error=type(e).__name__)
+                rerank_span.set(error=str(e))
+                return retrieved
+            rerank_span.set(**stats)
+        # What the fixed top-k would have sent vs what reranking keeps
+        retrieved_tokens = sum(count_tokens(doc.page_content) for doc in retrieved)
+        reranked_tokens = sum(count_tokens(doc.page_content) for doc in docs)
+        observe("rerank_context_tokens", retrieved_tokens, stage="retrieved")
+        observe("rerank_context_tokens", reranked_tokens, stage="reranked")
+        increment("rerank_tokens_saved", max(retrieved_tokens - reranked_tokens, 0))
+        return docs
+    
+    def _remember(self, question, answer):
+        # Save to memory
+        if self.memory:
+            self.memory.save_context({"input": question}, {"output": answer})
+            # Rolling-summary memory: exchanges that left the window are folded into the
+            # summary in the background, so the extra LLM call never delays an answer
+            if getattr(self.memory, "pending", None):
+                self.summary_future = _get_summary_executor().submit(
+                    contextvars.copy_context().run, self._summarize_memory
+                )
+    
+    def _summarize_memory(self):
+        with span("qa.memory_summarize"):
+            self.memory.compact(lambda prompt: complete_with_retry(self.llm, prompt))
+    
+    def _cache_answer(self, question, prepared, answer):
+        # Only freshly generated, non-error document answers are cached
+        if prepared.get("cache_vector") is None or not answer or answer.startswith("Error:"):
+            return
+        self.answer_cache.store(self.doc_key, question, prepared["cache_vector"], answer, prepared["docs"])
+    
+    def __call__(self, inputs):
+        question = inputs.get("question", "")
+        with span("qa.call") as call_span:
+            prepared = self._prepare(question)
             
             # Get answer
-            if hasattr(self.llm, '__call__'):
-                answer = self.llm(formatted_prompt)
-            else:
-                answer = self.llm.predict(formatted_prompt)
+            answer = prepared["answer"]
+            if answer is None:
+                with span("qa.llm"):
+                    if hasattr(self.llm, '__call__'):
+                        answer = self.llm(prepared["prompt"])
+                    else:
+                        answer = self.llm.predict(prepared["prompt"])
+                self._cache_answer(question, prepared, answer)
+            
+            with span("qa.memory_save"):
+                self._remember(question, answer)
+            call_span.set(question_type=prepared["question_type"], cached=prepared.get("cached", False))
+        increment("qa_questions", question_type=prepared["question_type"], mode="blocking")
+        
+        return {
+            "answer": answer,
+            "source_documents": prepared["docs"],
+            "question_type": prepared["question_type"],
+            "cached": prepared.get("cached", False)
+        }
+    
+    def stream(self, inputs):
+        """
+        Streaming variant of __call__
+        Retrieval happens immediately; iterate the returned StreamingAnswer for text chunks
+        """
+        question = inputs.get("question", "")
+        with span("qa.prepare"):
+            prepared = self._prepare(question)
+        increment("qa_questions", question_type=prepared["question_type"], mode="streaming")
+        return StreamingAnswer(self, question, prepared)
+    
+    def _retrieve_batch(self, questions, vectors):
+        """Retrieved docs per question, with one vectorized index search for the whole batch"""
+        retriever = self.retriever
+        if hasattr(retriever, "get_relevant_documents_batch"):
+            return retriever.get_relevant_documents_batch(questions, vectors)
+        vectorstore = getattr(retriever, "vectorstore", None)
+        if vectorstore is not None and hasattr(vectorstore, "index_to_docstore_id"):
+            search_kwargs = getattr(retriever, "search_kwargs", {})
+            return similarity_search_batch(
+                vectorstore, vectors,
+                k=search_kwargs.get("k", settings.RETRIEVAL_K),
+                filter=search_kwargs.get("filter"),
+                fetch_k=search_kwargs.get("fetch_k", 20)
+            )
+        return [retriever.get_relevant_documents(question) for question in questions]
+    
+    def _complete(self, prompt):
+        # One span per call, so token usage is recorded per request
+        with span("qa.llm_call"):
+            return complete_with_retry(self.llm, prompt)
+    
+    def batch(self, questions, max_in_flight=None):
+        """
+        Answer several questions in one pass: document questions are embedded together,
+        retrieved with a single index search (shared chunks fetched once) and sent to
+        the LLM concurrently, at most max_in_flight (QA_BATCH_MAX_IN_FLIGHT) at a time,
+        with retries on rate limits and transient errors
+        Every prompt sees the conversation as it was when the batch started; the
+        exchanges are saved to memory afterwards, in question order
+        Returns one __call__-shaped result per question, in order
+        """
+        max_in_flight = max_in_flight or settings.QA_BATCH_MAX_IN_FLIGHT
+        with span("qa.batch", questions=len(questions)) as batch_span:
+            engine = get_guardrail_engine()
+            with span("qa.classify"):
+                question_types = [engine.classify_question(question) for question in questions]
             
-            # Save to memory
-            if self.memory:
-                self.memory.save_context({"input": question}, {"output": answer})
+            document_questions = [i for i, question_type in enumerate(question_types) if question_type == "document"]
+            vectors = {}
+            retrieved = {}
+            if document_questions and self.embeddings is not None:
+                texts = [questions[i] for i in document_questions]
+                with span("qa.batch_embed", questions=len(texts)):
+                    embedded = self.embeddings.embed_documents(texts)
+                with span("qa.retrieval", questions=len(texts)) as retrieval_span:
+                    docs_per_question = self._retrieve_batch(texts, embedded)
+                    retrieval_span.set(docs=sum(len(docs) for docs in docs_per_question))
+                vectors = dict(zip(document_questions, embedded))
+                retrieved = dict(zip(document_questions, docs_per_question))
             
-            return {
-                "answer": answer,
-                "source_documents": docs[:4] if docs else [],
-                "question_type": question_type
-            }
-    
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-    return ConversationalQAChain(llm, retriever, prompt, memory)
\ No newline at end of file
+            prepared = [
+                self._prepare(question, question_type, vectors.get(i), retrieved.get(i))
+                for i, (question, question_type) in enumerate(zip(questions, question_types))
+            ]
+            
+            # LLM calls run on worker threads; copying the context keeps their spans under qa.batch
+            pending = [i for i, item in enumerate(prepared) if item["answer"] is None]
+            answers = [item["answer"] for item in prepared]
+            if pending:
+                with span("qa.llm", calls=len(pending)):
+                    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(pending))) as pool:
+                        futures = {
+                            i: pool.submit(contextvars.copy_context().run, self._complete, prepared[i]["prompt"])
+                            for i in pending
+                        }
+                        for i, future in futures.items():
+                            answers[i] = future.result()
+                            self._cache_answer(questions[i], prepared[i], answers[i])
+            
+            results = []
+            with span("qa.memory_save"):
+                for question, item, answer in zip(questions, prepared, answers):
+                    self._remember(question, answer)
+                    increment("qa_questions", question_type=item["question_type"], mode="batch")
+                    results.append({
+                        "answer": answer,
+                        "source_documents": item["docs"],
+                        "question_type": item["question_type"],
+                        "cached": item.get("cached", False)
+                    })
+            batch_span.set(llm_calls=len(pending), in_flight=max_in_flight)
+        return results
+
+class StreamingAnswer:
+    """
+    Iterable of answer text chunks for one question
+    source_documents and question_type are available up front; answer is set
+    (and memory updated) once iteration finishes, failed if the LLM errored partway
+    """
+    def __init__(self, chain, question, prepared):
+        self.chain = chain
+        self.question = question
+        self.prepared = prepared
+        self.cached = prepared.get("cached", False)
+        self.prompt = prepared["prompt"]
+        self.source_documents = prepared["docs"]
+        self.question_type = prepared["question_type"]
+        self.answer = prepared["answer"]
+        self.done = False
+        self.failed = False
+    
+    def __iter__(self):
+        if self.done:
+            yield self.answer
+            return
+        
+        if self.answer is not None:
+            chunks = iter([self.answer])
+            llm_span = None
+        elif hasattr(self.chain.llm, "stream"):
+            # Not a context manager: the stage spans yields back to the consumer
+            llm_span = start_span("qa.llm_stream")
+            chunks = self.chain.llm.stream(self.prompt)
+        else:
+            llm_span = start_span("qa.llm")
+            chunks = iter([self.chain.llm(self.prompt)])
+        
+        parts = []
+        completed = False
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    # The LLM failed partway: the error is shown after the partial answer,
+                    # which is never cached
+                    increment("llm_errors")
+                    self.failed = True
+                    parts.append(f"Error: {str(e)}")
+                    yield parts[-1]
+                    break
+                if not parts and llm_span is not None:
+                    observe("llm_first_token_seconds", time.perf_counter() - start)
+                parts.append(chunk)
+                yield chunk
+            completed = not self.failed
+            if completed and self.answer is None:
+                # Completed normally (not cut short or failed) - safe to cache
+                self.chain._cache_answer(self.question, self.prepared, "".join(parts))
+        finally:
+            if llm_span is not None:
+                llm_span.set(chunks=len(parts), completed=completed)
+                llm_span.finish()
+            # Also runs when the consumer stops early (e.g. a guardrail cut the stream)
+            self.answer = "".join(parts)
+            self.done = True
+            self.chain._remember(self.question, self.answer)
+    
+    def to_result(self):
+        """Same dict shape as ConversationalQAChain.__call__ (after iteration)"""
+        return {
+            "answer": self.answer,
+            "source_documents": self.source_documents,
+            "question_type": self.question_type,
+            "cached": self.cached
+        }
+
+def build_qa_chain(vectorstore, memory=None, doc_key=None, sources=None):
+    """
+    Build QA chain with document-focused prompting and conversation memory
+    doc_key (e.g. the index cache key) enables the shared semantic answer cache;
+    sources restricts retrieval to those source_ids in a multi-document store
+    """
+    
+    if _load_groq() is None:
+        # Groq SDK not installed
+        return "Currently I am not able to Response"
+    
+    # Use custom Groq implementation (client and connection pool are shared)
+    llm = GroqLLM(
+        api_key=settings.GROQ_API_KEY,
+        model_name=settings.MODEL_NAME,
+        temperature=0.1,
+        max_tokens=500
+    )
+    
+    # Build conversational chain with memory
+    return build_conversational_qa_chain(vectorstore, llm, memory, doc_key, sources)
+
+def get_cached_qa_chain(cache, vectorstore, memory=None, doc_key=None, sources=None, version=None):
+    """
+    Return the chain stored in cache (e.g. st.session_state), rebuilding it only
+    when the vectorstore, memory object, document key, source filter or
+    version (bumped when documents are added/removed in place) has changed
+    """
+    # The cached chain keeps both objects alive, so their ids cannot be reused
+    key = (id(vectorstore), id(memory), doc_key, tuple(sorted(sources or ())), version)
+    if cache.get("qa_chain_key") != key or cache.get("qa_chain") is None:
+        cache["qa_chain"] = build_qa_chain(vectorstore, memory, doc_key, sources)
+        cache["qa_chain_key"] = key
+    return cache["qa_chain"]
+
+def build_conversational_qa_chain(vectorstore, llm, memory=None, doc_key=None, sources=None):
+    """Build a conversational QA chain with memory and context handling"""
+    reranker = get_reranker()
+    # With reranking the retriever supplies a wider candidate set to choose from
+    k = max(settings.RERANK_CANDIDATES, settings.RETRIEVAL_K) if reranker is not None else settings.RETRIEVAL_K
+    if settings.HYBRID_RETRIEVAL:
+        retriever = HybridRetriever(
+            vectorstore, get_lexical_index(vectorstore), k=k,
+            fetch_k=max(settings.HYBRID_FETCH_K, k), sources=sources
+        )
+    elif sources:
+        allowed = set(sources)
+        retriever = vectorstore.as_retriever(search_kwargs={
+            "k": k,
+            "filter": lambda metadata: metadata.get("source_id") in allowed
+        })
+    else:
+        retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+    return ConversationalQAChain(
+        llm, retriever, get_qa_prompt(), memory,
+        answer_cache=get_answer_cache(),
+        doc_key=doc_key,
+        embeddings=getattr(vectorstore, "embedding_function", None),
+        reranker=reranker
+    )
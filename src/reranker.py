@@ -0,0 +1,104 @@
+# src/reranker.py
+# Optional cross-encoder reranking between retrieval and prompt building (RERANK_ENABLED):
+# a wider candidate set is scored against the question and only the best chunks reach the LLM
+import threading
+from collections import OrderedDict
+from src.metrics import increment
+from src.config import settings
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a small sentence-transformers CrossEncoder on CPU
+    Candidates are scored in batches in retrieval order; scoring stops once a whole batch
+    falls more than score_gap below the current top_n, and chunks more than score_gap
+    below the best are dropped. Scores are cached per (question, chunk text), LRU
+    """
+    def __init__(self, model_name, batch_size=8, score_gap=4.0, cache_size=10000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.score_gap = score_gap
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()  # (question, text) -> score, oldest first
+        self._cache_lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    # Pulls in torch, so only imported when reranking is first needed
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warm_up(self):
+        self._get_model().predict([("warm up", "warm up")], show_progress_bar=False)
+
+    def _cached(self, key):
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, question, docs, top_n):
+        """
+        Best docs for question, at most top_n, in score order
+        Returns (docs, stats) with candidates, scored (model pairs), cache_hits and kept
+        """
+        keys = [(question, doc.page_content) for doc in docs]
+        scores = [self._cached(key) for key in keys]
+        cache_hits = sum(score is not None for score in scores)
+        scored = 0
+        for start in range(0, len(docs), self.batch_size):
+            end = min(start + self.batch_size, len(docs))
+            batch = [i for i in range(start, end) if scores[i] is None]
+            if batch:
+                predicted = self._get_model().predict(
+                    [(question, docs[i].page_content) for i in batch],
+                    batch_size=self.batch_size, show_progress_bar=False
+                )
+                for i, score in zip(batch, predicted):
+                    scores[i] = float(score)
+                    self._store(keys[i], scores[i])
+                scored += len(batch)
+            # Lower-ranked candidates rarely beat a top_n this far ahead of a whole batch
+            known = sorted((score for score in scores if score is not None), reverse=True)
+            if start and end < len(docs) and len(known) >= top_n and max(scores[start:end]) < known[top_n - 1] - self.score_gap:
+                break
+
+        ranked = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i])[:top_n]
+        if ranked:
+            best = scores[ranked[0]]
+            ranked = [i for i in ranked if scores[i] >= best - self.score_gap]
+        increment("rerank_pairs", scored, result="scored")
+        increment("rerank_pairs", cache_hits, result="cached")
+        return [docs[i] for i in ranked], {
+            "candidates": len(docs), "scored": scored, "cache_hits": cache_hits, "kept": len(ranked)
+        }
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    """Shared reranker for this process, or None when RERANK_ENABLED is off"""
+    global _reranker
+    if not settings.RERANK_ENABLED:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker(
+                settings.RERANK_MODEL,
+                batch_size=settings.RERANK_BATCH_SIZE,
+                score_gap=settings.RERANK_SCORE_GAP,
+                cache_size=settings.RERANK_CACHE_SIZE
+            )
+        return _reranker
@@ -1,41 +1,505 @@
-from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.base import Docstore
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from src.embeddings import get_embeddings_client
+from src.lexical_index import build_lexical_index, save_lexical_index
+from src.metrics import span, increment, observe
 from src.config import settings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import json
+import math
+import numpy as np
 import os
+import threading
+import time
+import weakref
 
-os.makedirs(settings.PERSIST_DIR, exist_ok=True)
+# faiss, LangChain's FAISS store and the text splitter are imported inside the
+# functions that use them: together they are most of this module's import time
+
+def _get_text_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.MAX_CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP
+    )
+
+def iter_page_chunks(pages, metadata=None):
+    """
+    Split (page_number, text) pairs into Documents one page at a time
+    Each chunk records its page and start/end character offsets within that page
+    """
+    text_splitter = _get_text_splitter()
+    base_metadata = metadata or {}
+
+    for page_number, page_text in pages:
+        search_from = 0
+        for chunk in text_splitter.split_text(page_text):
+            # Chunks come back in order, so search forward from the previous hit
+            start = page_text.find(chunk, search_from)
+            if start < 0:
+                start = page_text.find(chunk)
+            end = start + len(chunk) if start >= 0 else -1
+            if start >= 0:
+                search_from = start + 1
+
+            chunk_metadata = dict(base_metadata)
+            chunk_metadata.update({"page": page_number, "start_index": start, "end_index": end})
+            yield Document(page_content=chunk, metadata=chunk_metadata)
 
 def build_or_load_faiss(text, metadata=None, session_id=None):
     """
     Build FAISS vector store for a specific session/file
     Each session gets its own vector store to prevent cross-contamination
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.MAX_CHUNK_SIZE,
-        chunk_overlap=settings.CHUNK_OVERLAP
-    )
-    
+    from langchain_community.vectorstores import FAISS
     # Split text into chunks
-    chunks = text_splitter.split_text(text)
-    docs = [Document(page_content=chunk, metadata=metadata or {}) for chunk in chunks]
-    
+    docs = list(iter_page_chunks([(None, text)], metadata))
+
     # Get embeddings client
     embed = get_embeddings_client()
-    
+
     # Create session-specific directory if session_id provided
     if session_id:
         session_dir = os.path.join(settings.PERSIST_DIR, f"session_{session_id}")
         os.makedirs(session_dir, exist_ok=True)
-        
+
         # Always create fresh vector store for new session
-        db = FAISS.from_documents(docs, embed)
+        db = finalize_index(FAISS.from_documents(docs, embed))
         db.save_local(session_dir)
+        if settings.HYBRID_RETRIEVAL:
+            build_lexical_index(db)
+            save_lexical_index(db, session_dir)
         return db
     else:
         # Legacy behavior - create fresh vector store each time
-        db = FAISS.from_documents(docs, embed)
+        db = finalize_index(FAISS.from_documents(docs, embed))
+        return db
+
+_torch_threads_configured = False
+_torch_lock = threading.Lock()
+
+def _configure_torch_threads():
+    """Apply EMBED_TORCH_THREADS to torch's intra-op pool once per process"""
+    global _torch_threads_configured
+    if _torch_threads_configured or settings.EMBED_TORCH_THREADS <= 0:
+        return
+    with _torch_lock:
+        if not _torch_threads_configured:
+            try:
+                import torch
+                torch.set_num_threads(settings.EMBED_TORCH_THREADS)
+            except ImportError:
+                pass
+            _torch_threads_configured = True
+
+def _iter_batches(items, batch_size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def iter_embedded_batches(docs, embed=None, batch_size=None, workers=None):
+    """
+    Embed Documents in batches on a thread pool, yielding (batch_docs, vectors) in order
+    docs may be a generator; at most workers * 2 batches are held in memory
+    """
+    embed = embed or get_embeddings_client()
+    batch_size = batch_size or settings.EMBED_BATCH_SIZE
+    workers = max(workers or settings.EMBED_WORKERS, 1)
+    _configure_torch_threads()
+
+    def embed_batch(batch):
+        start = time.perf_counter()
+        vectors = embed.embed_documents([doc.page_content for doc in batch])
+        observe("embed_batch_seconds", time.perf_counter() - start)
+        increment("embedded_chunks", len(batch))
+        return batch, vectors
+
+    batches = _iter_batches(docs, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield embed_batch(batch)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+        for batch in batches:
+            pending.append(pool.submit(embed_batch, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def build_faiss_incrementally(docs, embed=None, status_callback=None):
+    """
+    Build a FAISS store by streaming embedded batches into it
+    Reports progress and chunks/sec through status_callback
+    """
+    from langchain_community.vectorstores import FAISS
+    embed = embed or get_embeddings_client()
+    db = None
+    embedded = 0
+    start = time.perf_counter()
+
+    for batch_docs, vectors in iter_embedded_batches(docs, embed):
+        text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch_docs, vectors)]
+        metadatas = [doc.metadata for doc in batch_docs]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embed, metadatas=metadatas)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas)
+
+        embedded += len(batch_docs)
+        if status_callback:
+            elapsed = time.perf_counter() - start
+            rate = embedded / elapsed if elapsed > 0 else 0.0
+            status_callback(f" Embedded {embedded} chunks ({rate:.1f} chunks/sec)")
+
+    if status_callback and embedded:
+        elapsed = time.perf_counter() - start
+        status_callback(f" Indexed {embedded} chunks in {elapsed:.2f}s")
+    with span("ingest.index_finalize", chunks=embedded):
+        db = finalize_index(db, status_callback=status_callback)
+    if db is not None and settings.HYBRID_RETRIEVAL:
+        # BM25 index over the same chunks, used for hybrid retrieval
+        with span("ingest.lexical_index", chunks=embedded):
+            build_lexical_index(db)
+    return db
+
+INDEX_TYPES = ("flat", "hnsw", "hnsw_sq", "ivf_flat", "ivf_pq", "ivf_sq")
+
+def choose_index_type(n_vectors, index_type=None):
+    """Resolve FAISS_INDEX_TYPE; "auto" picks flat / HNSW / IVF-SQ8 by corpus size"""
+    index_type = (index_type or settings.FAISS_INDEX_TYPE).lower()
+    if index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES} or 'auto'")
+        return index_type
+
+    if n_vectors < settings.FAISS_HNSW_MIN_CHUNKS:
+        return "flat"
+    if n_vectors < settings.FAISS_IVF_MIN_CHUNKS:
+        return "hnsw"
+    # IVF-PQ compresses further but loses too much recall to be a safe default
+    return "ivf_sq"
+
+def _ivf_nlist(n_vectors):
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+    nlist = settings.FAISS_IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39))
+
+def _pq_params(dim, n_vectors):
+    # Sub-quantizer count must divide the dimension
+    m = max(d for d in range(1, min(settings.FAISS_PQ_M, dim) + 1) if dim % d == 0)
+    # 8-bit codebooks need ~256*39 training points; use fewer bits on small corpora
+    nbits = max(4, min(8, int(math.log2(max(n_vectors // 39, 1)))))
+    return m, nbits
+
+def make_index_factory_string(index_type, dim, n_vectors):
+    """faiss.index_factory description for an index type and corpus size"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{settings.FAISS_HNSW_M}"
+    if index_type == "hnsw_sq":
+        return f"HNSW{settings.FAISS_HNSW_M},SQ8"
+
+    nlist = _ivf_nlist(n_vectors)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq":
+        return f"IVF{nlist},SQ8"
+    m, nbits = _pq_params(dim, n_vectors)
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+def build_faiss_index(vectors, index_type=None):
+    """Train (if needed) and fill a FAISS index of the configured type with vectors"""
+    import faiss
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    index_type = choose_index_type(n_vectors, index_type)
+
+    index = faiss.index_factory(dim, make_index_factory_string(index_type, dim, n_vectors), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+
+    # Search-time knobs are stored in the index, so they survive save/load
+    params = faiss.ParameterSpace()
+    if index_type.startswith("hnsw"):
+        params.set_index_parameter(index, "efSearch", settings.FAISS_HNSW_EF_SEARCH)
+    elif index_type.startswith("ivf"):
+        params.set_index_parameter(index, "nprobe", settings.FAISS_IVF_NPROBE)
+    return index
+
+def finalize_index(db, index_type=None, status_callback=None):
+    """
+    Swap db's flat index for the configured index type once the corpus size is known
+    Vector order is preserved, so the docstore mapping stays valid
+    """
+    if db is None:
+        return db
+    n_vectors = db.index.ntotal
+    index_type = choose_index_type(n_vectors, index_type)
+    if index_type != "flat":
+        start = time.perf_counter()
+        db.index = build_faiss_index(db.index.reconstruct_n(0, n_vectors), index_type)
+        if status_callback:
+            status_callback(f" Built {index_type} index over {n_vectors} chunks in {time.perf_counter() - start:.2f}s")
+    return db
+
+def create_vectorstore_from_pages(pages, metadata=None, status_callback=None):
+    """
+    Create a fresh vector store from a (page_number, text) iterable
+    Pages are chunked and embedded as they arrive, so the full document text is never built
+    Returns None if no chunks were produced
+    """
+    return build_faiss_incrementally(iter_page_chunks(pages, metadata), status_callback=status_callback)
+
+def _reconstruct_vectors(index, positions=None):
+    """Stored vectors in index order (approximate for quantized indexes)"""
+    import faiss
+    if positions is None:
+        positions = range(index.ntotal)
+    try:
+        return np.vstack([index.reconstruct(int(i)) for i in positions]) if len(positions) else None
+    except RuntimeError:
+        # IVF indexes need a direct map before vectors can be looked up by id
+        faiss.extract_index_ivf(index).make_direct_map()
+        return np.vstack([index.reconstruct(int(i)) for i in positions]) if len(positions) else None
+
+def _maybe_upgrade_index(db):
+    # Session stores start flat and switch to an ANN index once they grow past the auto thresholds
+    import faiss
+    if isinstance(db.index, faiss.IndexFlat) and choose_index_type(db.index.ntotal) != "flat":
+        finalize_index(db)
+
+def add_vectorstore(session_db, doc_db, source_id, source_name=None, embed=None):
+    """
+    Add every chunk of a single-document store to a multi-document session store
+    Vectors are copied, not re-embedded. Chunk ids are "<source_id>:<n>" and
+    metadata gets source_id/source so chunks can be filtered and removed later.
+    Returns the session store (a new one if session_db is None)
+    """
+    from langchain_community.vectorstores import FAISS
+    positions = range(len(doc_db.index_to_docstore_id))
+    vectors = _reconstruct_vectors(doc_db.index, positions)
+    if vectors is None:
+        return session_db
+
+    texts, metadatas, ids = [], [], []
+    for position in positions:
+        doc = doc_db.docstore.search(doc_db.index_to_docstore_id[position])
+        metadata = dict(doc.metadata)
+        metadata["source_id"] = source_id
+        if source_name:
+            metadata["source"] = source_name
+        texts.append(doc.page_content)
+        metadatas.append(metadata)
+        ids.append(f"{source_id}:{position}")
+
+    text_embeddings = list(zip(texts, vectors.tolist()))
+    if session_db is None:
+        session_db = FAISS.from_embeddings(text_embeddings, embed or get_embeddings_client(), metadatas=metadatas, ids=ids)
+    else:
+        session_db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    _maybe_upgrade_index(session_db)
+
+    if settings.HYBRID_RETRIEVAL:
+        build_lexical_index(session_db)
+    return session_db
+
+def remove_source(session_db, source_id):
+    """
+    Delete every chunk of source_id from a session store
+    Returns the store, or None once it holds no chunks
+    """
+    import faiss
+    prefix = f"{source_id}:"
+    doomed = {doc_id for doc_id in session_db.index_to_docstore_id.values() if doc_id.startswith(prefix)}
+    if not doomed:
+        return session_db
+    if len(doomed) == len(session_db.index_to_docstore_id):
+        return None
+
+    if isinstance(session_db.index, faiss.IndexFlat):
+        session_db.delete(list(doomed))
+    else:
+        # HNSW has no remove_ids and IVF keeps stale labels, so refill an empty
+        # copy of the (already trained) index with the remaining vectors
+        keep = [i for i in range(len(session_db.index_to_docstore_id)) if session_db.index_to_docstore_id[i] not in doomed]
+        vectors = _reconstruct_vectors(session_db.index, keep)
+        kept_ids = [session_db.index_to_docstore_id[i] for i in keep]
+        index = faiss.clone_index(session_db.index)
+        index.reset()
+        index.add(vectors)
+        session_db.index = index
+        session_db.index_to_docstore_id = dict(enumerate(kept_ids))
+        session_db.docstore.delete(list(doomed))
+
+    if settings.HYBRID_RETRIEVAL:
+        build_lexical_index(session_db)
+    return session_db
+
+def update_session_vectorstore(current, doc_stores, names, added=None, removed=None):
+    """
+    Return the store a session should search after a document is added or removed
+    doc_stores maps source_id -> shared, read-only per-document store (still
+    including `removed`); names maps source_id -> display name.
+    One document: its shared memory-mapped store is used directly (no copy).
+    Several: a private combined store, updated incrementally.
+    """
+    ready = [source_id for source_id in doc_stores if source_id != removed]
+    is_shared = current is None or any(current is store for store in doc_stores.values())
+
+    if len(ready) <= 1:
+        return doc_stores[ready[0]] if ready else None
+    if is_shared:
+        # Second document arrived: copy every ready document into a private store
+        store = None
+        for source_id in ready:
+            store = add_vectorstore(store, doc_stores[source_id], source_id, names.get(source_id))
+        return store
+    if added:
+        return add_vectorstore(current, doc_stores[added], added, names.get(added))
+    if removed:
+        return remove_source(current, removed)
+    return current
+
+def list_sources(session_db):
+    """Distinct source_id values present in a session store"""
+    if session_db is None:
+        return set()
+    return {doc_id.split(":", 1)[0] for doc_id in session_db.index_to_docstore_id.values()}
+
+def similarity_search_batch(db, vectors, k=4, filter=None, fetch_k=20):
+    """
+    FAISS.similarity_search_by_vector for many query vectors with one index.search call
+    filter is a metadata predicate (as in as_retriever search_kwargs); a chunk
+    returned for several queries is fetched from the docstore once
+    """
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    if getattr(db, "_normalize_L2", False):
+        import faiss
+        matrix = np.ascontiguousarray(matrix)
+        faiss.normalize_L2(matrix)
+    _, positions = db.index.search(matrix, k if filter is None else max(k, fetch_k))
+    fetched = {}
+    results = []
+    for row in positions:
+        docs = []
+        for i in row:
+            if i == -1:
+                continue
+            doc_id = db.index_to_docstore_id[i]
+            if doc_id not in fetched:
+                fetched[doc_id] = db.docstore.search(doc_id)
+            doc = fetched[doc_id]
+            if filter is None or filter(doc.metadata):
+                docs.append(doc)
+            if len(docs) == k:
+                break
+        results.append(docs)
+    return results
+
+# Read-only on-disk format: FAISS index + texts/metadata blobs addressed by offsets,
+# all memory-mapped so every session and worker process shares the same page cache
+MMAP_INDEX_FILE = "index.faiss"
+_TEXTS_FILE = "texts.bin"
+_METADATA_FILE = "metadata.bin"
+_OFFSETS_FILE = "offsets.npy"
+_IDS_FILE = "ids.json"
+
+class MmapDocstore(Docstore):
+    """Read-only docstore over memory-mapped text and metadata blobs"""
+    def __init__(self, directory):
+        offsets = np.load(os.path.join(directory, _OFFSETS_FILE), mmap_mode="r")
+        self._text_offsets = offsets[0]
+        self._metadata_offsets = offsets[1]
+        self._texts = self._map(os.path.join(directory, _TEXTS_FILE))
+        self._metadata = self._map(os.path.join(directory, _METADATA_FILE))
+        with open(os.path.join(directory, _IDS_FILE), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    @staticmethod
+    def _map(path):
+        # np.memmap refuses empty files
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def search(self, search):
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        text = self._texts[self._text_offsets[position]:self._text_offsets[position + 1]].tobytes().decode("utf-8")
+        metadata = self._metadata[self._metadata_offsets[position]:self._metadata_offsets[position + 1]].tobytes()
+        return Document(page_content=text, metadata=json.loads(metadata))
+
+    def __len__(self):
+        return len(self.ids)
+
+def save_mmap_vectorstore(db, directory):
+    """Write db in the memory-mappable format (see load_mmap_vectorstore)"""
+    import faiss
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(db.index, os.path.join(directory, MMAP_INDEX_FILE))
+
+    ids = [db.index_to_docstore_id[i] for i in range(len(db.index_to_docstore_id))]
+    offsets = np.zeros((2, len(ids) + 1), dtype=np.int64)
+    with open(os.path.join(directory, _TEXTS_FILE), "wb") as texts, \
+            open(os.path.join(directory, _METADATA_FILE), "wb") as metadata:
+        for i, doc_id in enumerate(ids):
+            doc = db.docstore.search(doc_id)
+            text_bytes = doc.page_content.encode("utf-8")
+            metadata_bytes = json.dumps(doc.metadata, default=str).encode("utf-8")
+            texts.write(text_bytes)
+            metadata.write(metadata_bytes)
+            offsets[0, i + 1] = offsets[0, i] + len(text_bytes)
+            offsets[1, i + 1] = offsets[1, i] + len(metadata_bytes)
+    np.save(os.path.join(directory, _OFFSETS_FILE), offsets)
+    with open(os.path.join(directory, _IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+
+# One live store per directory per process; dropped once no session references it
+_shared_stores = weakref.WeakValueDictionary()
+_shared_stores_lock = threading.Lock()
+
+def load_mmap_vectorstore(directory, embed=None):
+    """
+    Load a store written by save_mmap_vectorstore, memory-mapping index and docstore
+    Returns a shared, read-only FAISS store: never add to or delete from it
+    (add_vectorstore copies it into a private store instead)
+    """
+    from langchain_community.vectorstores import FAISS
+    import faiss
+    key = os.path.realpath(directory)
+    with _shared_stores_lock:
+        db = _shared_stores.get(key)
+        if db is not None:
+            return db
+
+        # IO_FLAG_MMAP_IFC maps flat/HNSW/IVF codes straight from the file
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        index_path = os.path.join(directory, MMAP_INDEX_FILE)
+        try:
+            index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(index_path)
+
+        docstore = MmapDocstore(directory)
+        db = FAISS(
+            embedding_function=embed or get_embeddings_client(),
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(docstore.ids))
+        )
+        _shared_stores[key] = db
         return db
 
 def create_fresh_vectorstore(text, metadata=None):
@@ -46,28 +510,8 @@ def create_fresh_vectorstore(text, metadata=None):
     # Check if text is empty or None
     if not text or not text.strip():
         return None  # Return None instead of raising error
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.MAX_CHUNK_SIZE,
-        chunk_overlap=settings.CHUNK_OVERLAP
-    )
-    
-    chunks = text_splitter.split_text(text)
-    
-    # Check if chunks were created
-    if not chunks:
-        return None  # Return None instead of raising error
-    
-    docs = [Document(page_content=chunk, metadata=metadata or {}) for chunk in chunks]
-    
-    # Check if documents were created
-    if not docs:
-        return None  # Return None instead of raising error
-    
-    embed = get_embeddings_client()
-    db = FAISS.from_documents(docs, embed)
-    
-    return db
+
+    return create_vectorstore_from_pages([(None, text)], metadata)
 
 def cleanup_session_data(session_id):
     """Clean up vector store data for a specific session"""
@@ -0,0 +1,107 @@
+# src/warmup.py
+# Background warm-up: pays the first-use costs (heavy imports, embedding model,
+# reranker, OCR engines, compiled guardrails, tokenizer) off the request path, once per process
+import threading
+import time
+from src.metrics import span, observe
+from src.config import settings
+
+def _import_heavy_modules():
+    """Modules the ingest and answer paths import on first use"""
+    import faiss
+    import fitz
+    from langchain_community.vectorstores import FAISS
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+def _warm_up_embeddings():
+    from src.embeddings import warm_up_embeddings
+    warm_up_embeddings()
+
+def _warm_up_qa():
+    from src.context_packer import count_tokens
+    from src.guardrail import get_guardrail_engine
+    from src.qa_chain import get_qa_prompt
+    get_guardrail_engine()
+    get_qa_prompt()
+    count_tokens("warm up")
+
+def _warm_up_reranker():
+    from src.reranker import get_reranker
+    get_reranker().warm_up()
+
+def _warm_up_ocr():
+    from src.ocr_engine import warm_up_ocr
+    warm_up_ocr()
+
+def default_stages(ocr=None):
+    """(name, callable) pairs run in order; OCR only with OCR_WARM_START unless ocr is given"""
+    stages = [("imports", _import_heavy_modules), ("embeddings", _warm_up_embeddings), ("qa", _warm_up_qa)]
+    if settings.RERANK_ENABLED:
+        stages.append(("reranker", _warm_up_reranker))
+    if settings.OCR_WARM_START if ocr is None else ocr:
+        stages.append(("ocr", _warm_up_ocr))
+    return stages
+
+class WarmUp:
+    """
+    One warm-up run on a daemon thread
+    A failed stage is recorded and skipped; the work it would have done happens on first use
+    """
+    def __init__(self, stages):
+        self.stages = stages
+        self.timings = {}  # stage -> seconds
+        self.errors = {}  # stage -> message
+        self.status = "pending"
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.status = "running"
+        self._thread = threading.Thread(target=self._run, name="qabot-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        total = time.perf_counter()
+        for name, func in self.stages:
+            start = time.perf_counter()
+            try:
+                with span(f"warmup.{name}"):
+                    func()
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+            self.timings[name] = time.perf_counter() - start
+            observe("warmup_seconds", self.timings[name], stage=name)
+        self.timings["total"] = time.perf_counter() - total
+        self.status = "failed" if self.errors else "ready"
+        self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until every stage has run; False on timeout"""
+        return self._done.wait(timeout)
+
+    def describe(self):
+        return {
+            "status": self.status,
+            "timings": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            "errors": dict(self.errors),
+        }
+
+_warm_up = None
+_warm_up_lock = threading.Lock()
+
+def start_warm_up(ocr=None):
+    """Start this process's warm-up (once); later calls return the same run"""
+    global _warm_up
+    with _warm_up_lock:
+        if _warm_up is None:
+            _warm_up = WarmUp(default_stages(ocr)).start()
+        return _warm_up
+
+def get_warm_up():
+    """The process's warm-up run, or None if it was never started"""
+    return _warm_up